@@ -37,8 +37,22 @@ sys.path.append(os.path.join(PLUGIN_DIR, "lib"))
 import xml 
 xml.__path__.append(os.path.join(PLUGIN_DIR, "lib", "xml"))
 import youtube_dl
+from youtube_dl.postprocessor import FFmpegExtractAudioPP
+from youtube_dl.utils import DEFAULT_OUTTMPL
 del sys.path[-1]
 _IS_DOWNLOADING=False # checks if download is in progress
+URL_PATTERN=re.compile(r"(^|[ \t\r\n])((http|https|www\.):?(([A-Za-z0-9$_.+!*(),;/?:@&~=-])|%[A-Fa-f0-9]{2}){2,}(#([a-zA-Z0-9][a-zA-Z0-9$_.+!*(),;/?:@&~=%-]*))?([A-Za-z0-9$_+!*();/?:~-]))")
+# Number of URLs of a selection that are extracted at once
+BATCH_EXTRACTIONS=4
+
+def findURLs(text):
+	"""Returns every URL address in text, without duplicates, in the order they appear."""
+	urls=[]
+	for match in URL_PATTERN.finditer(text):
+		url=unicode(match.group(2))
+		if url not in urls:
+			urls.append(url)
+	return urls
 
 class speakingLogger(object):
 
@@ -63,36 +77,101 @@ def speakingHook(d):
 	elif d['status'] == 'error':
 		ui.message(_("Download error."))
 
+class downloaderService(object):
+	"""Runs all downloads of the add-on with a single YoutubeDL instance.
+
+	The instance is created on the first download and kept afterwards, so its opener, cookies and extractor instances, and the ffmpeg detection of its audio converters, are shared by every job.
+	Jobs run one at a time; each one sets its own output folder, audio format and YoutubeDL options, which are undone when the job ends.
+	"""
+
+	def __init__(self, opts):
+		self._opts=opts
+		self._ydl=None
+		self._audioConverters={}
+		self._lock=threading.Lock()
+
+	def _getYoutubeDL(self):
+		if self._ydl is None:
+			self._ydl=youtube_dl.YoutubeDL(self._opts)
+		return self._ydl
+
+	def _getAudioConverter(self, codec, quality):
+		# Each converter looks for ffmpeg when created, so they are kept for later jobs
+		key=(codec, quality)
+		if key not in self._audioConverters:
+			self._audioConverters[key]=FFmpegExtractAudioPP(self._ydl, preferredcodec=codec, preferredquality=quality)
+		return self._audioConverters[key]
+
+	def download(self, urls, path, codec, quality, **overrides):
+		"""Downloads urls into the folder path, converting them to audio with the given codec and quality.
+		overrides are YoutubeDL options that apply to this job only. Returns the YoutubeDL return code.
+		"""
+		with self._lock:
+			ydl=self._getYoutubeDL()
+			savedParams=dict(ydl.params)
+			ydl.params.update(overrides)
+			ydl.params['outtmpl']=os.path.join(path.replace('%', '%%'), DEFAULT_OUTTMPL)
+			ydl.add_post_processor(self._getAudioConverter(codec, quality))
+			try:
+				return ydl.download(urls)
+			finally:
+				ydl.params.clear()
+				ydl.params.update(savedParams)
+				# The post processor chain and the counters behind autonumber, max_downloads and the return code start over with the next job
+				del ydl._pps[:]
+				ydl._num_downloads=0
+				ydl._download_retcode=0
+
+	def close(self):
+		# A running job keeps the instance; closing must not wait for it
+		if not self._lock.acquire(False):
+			return
+		try:
+			if self._ydl is not None:
+				self._ydl.__exit__(None, None, None)
+				self._ydl=None
+				self._audioConverters.clear()
+		finally:
+			self._lock.release()
+
+service=downloaderService({
+	'logger':speakingLogger(),
+	'progress_hooks':[speakingHook],
+	'quiet':True,
+	'format':'bestaudio/best',
+})
+
 def download(selection):
 	global _IS_DOWNLOADING
-	currentDirectory=os.getcwdu()
-	ydl_opts={
-		'logger':speakingLogger(),
-		'progress_hooks':[speakingHook],
-		'quiet':True,
-		'format':'bestaudio/best',
-		'postprocessors':[{
-			'key':'FFmpegExtractAudio',
-			'preferredcodec':addonConfig.conf['converter']['format'],
-			'preferredquality':addonConfig.conf['converter']['quality'],
-			}],
-	}
-	urlPattern=re.compile(r"(^|[ \t\r\n])((http|https|www\.):?(([A-Za-z0-9$_.+!*(),;/?:@&~=-])|%[A-Fa-f0-9]{2}){2,}(#([a-zA-Z0-9][a-zA-Z0-9$_.+!*(),;/?:@&~=%-]*))?([A-Za-z0-9$_+!*();/?:~-]))")
-	address=urlPattern.search(selection)
-	if address:
+	overrides={}
+	urls=findURLs(selection)
+	if len(urls)>1:
+		# One failing link should not stop the rest of the batch
+		overrides['ignoreerrors']=True
+		overrides['concurrent_extractions']=BATCH_EXTRACTIONS
+	if urls:
 		try:
-			os.chdir(addonConfig.conf['downloader']['path'])
 			_IS_DOWNLOADING=True
-			ui.message(_("Starting download."))
-			with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-				ydl.download([unicode(address.group().strip())])
-				os.chdir(currentDirectory)
-				_IS_DOWNLOADING=False
+			if len(urls)>1:
+				# Translators: This message is spoken when downloading all URL addresses of a selection.
+				ui.message(_("Starting download of {count} addresses.").format(count=len(urls)))
+			else:
+				ui.message(_("Starting download."))
+			retcode=service.download(urls,
+				addonConfig.conf['downloader']['path'],
+				addonConfig.conf['converter']['format'],
+				addonConfig.conf['converter']['quality'],
+				**overrides)
+			_IS_DOWNLOADING=False
+			if retcode:
+				nvwave.playWaveFile(os.path.join(SOUNDS_DIR, "error.wav"))
+				# Translators: This message is spoken if some addresses of a selection could not be downloaded.
+				ui.message(_("Done, but some downloads failed."))
+			else:
 				nvwave.playWaveFile(os.path.join(SOUNDS_DIR, "done.wav"))
 				ui.message(_("Done."))
 		except:
 			_IS_DOWNLOADING=False
-			os.chdir(currentDirectory)
 			nvwave.playWaveFile(os.path.join(SOUNDS_DIR, "error.wav"))
 			ui.message(_("Download error."))
 	else:
@@ -161,6 +240,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 			addonConfig.save()
 
 	def terminate(self):
+		service.close()
 		try:
 			self.menu.RemoveItem(self.youtubeDownloaderMenuItem)
 		except wx.PyDeadObjectError:
@@ -183,7 +263,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 			ui.message(_("Nothing selected."))
 		else:
 			threading.Thread(target=download, args=(info.text,)).start()
-	script_downloadVideo.__doc__=_(u"Downloads a video with Youtube-DL from currently selected URL address.")
+	script_downloadVideo.__doc__=_(u"Downloads videos with Youtube-DL from all URL addresses in the current selection.")
 
 	__gestures={
 		"kb:NVDA+F8":"downloadVideo"
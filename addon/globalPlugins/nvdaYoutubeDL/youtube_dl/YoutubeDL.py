@@ -6,8 +6,8 @@ from __future__ import absolute_import, unicode_literals
 import collections
 import contextlib
 import datetime
-import errno
 import fileinput
+import functools
 import io
 import itertools
 import json
@@ -41,11 +41,13 @@ from .compat import (
     compat_urllib_request_DataHandler,
 )
 from .utils import (
+    BackgroundCall,
     ContentTooShortError,
     date_from_str,
     DateRange,
     DEFAULT_OUTTMPL,
     determine_ext,
+    DownloadArchive,
     DownloadError,
     encode_compat_str,
     encodeFilename,
@@ -53,10 +55,10 @@ from .utils import (
     ExtractorError,
     format_bytes,
     formatSeconds,
-    locked_file,
     make_HTTPS_handler,
     MaxDownloadsReached,
     PagedList,
+    parallel_map,
     parse_filesize,
     PerRequestProxyHandler,
     PostProcessingError,
@@ -81,7 +83,7 @@ from .utils import (
     args_to_str,
     age_restricted,
 )
-from .cache import Cache
+from .cache import Cache, ExtractionCache
 from .extractor import get_info_extractor, gen_extractors
 from .downloader import get_suitable_downloader
 from .downloader.rtmp import rtmpdump_version
@@ -145,6 +147,11 @@ class YoutubeDL(object):
     restrictfilenames: Do not allow "&" and spaces in file names
     ignoreerrors:      Do not stop on download errors.
     force_generic_extractor: Force downloader to use the generic extractor
+    concurrent_extractions: When downloading several URLs, extract up to this
+                       many of them at once, ahead of the one being
+                       downloaded. Videos are still downloaded one by one, in
+                       order. None or 1 to extract each URL just before its
+                       download.
     nooverwrites:      Prevent overwriting files.
     playliststart:     Playlist item to start at.
     playlistend:       Playlist item to end at.
@@ -171,6 +178,9 @@ class YoutubeDL(object):
     skip_download:     Skip the actual download of the video file
     cachedir:          Location of the cache files in the filesystem.
                        False to disable filesystem cache.
+    extraction_cache_ttl: Reuse the extraction result of a video URL for up
+                       to this many seconds (shorter if its media URLs expire
+                       earlier). None or 0 to always extract again.
     noplaylist:        Download single video instead of a playlist if in doubt.
     age_limit:         An integer representing the user's age in years.
                        Unsuitable videos for the given age are skipped.
@@ -260,9 +270,11 @@ class YoutubeDL(object):
 
     The following parameters are not used by YoutubeDL itself, they are used by
     the downloader (see youtube_dl/downloader/common.py):
-    nopart, updatetime, buffersize, ratelimit, min_filesize, max_filesize, test,
+    nopart, updatetime, buffersize, ratelimit, ratelimit_burst, min_filesize,
+    max_filesize, test,
     noresizebuffer, retries, continuedl, noprogress, consoletitle,
-    xattr_set_filesize, external_downloader_args.
+    xattr_set_filesize, external_downloader_args, preallocate,
+    hls_adaptive_max_eta, concurrent_fragment_downloads.
 
     The following options are used by the post processors:
     prefer_ffmpeg:     If True, use ffmpeg instead of avconv if both are available,
@@ -277,6 +289,8 @@ class YoutubeDL(object):
     _download_retcode = None
     _num_downloads = None
     _screen_file = None
+    # Number of subtitles or thumbnails of a video downloaded at once
+    _SIDECAR_DOWNLOAD_WORKERS = 4
 
     def __init__(self, params=None, auto_init=True):
         """Create a FileDownloader object with the given options."""
@@ -296,6 +310,12 @@ class YoutubeDL(object):
         }
         self.params.update(params)
         self.cache = Cache(self)
+        self.extraction_cache = ExtractionCache(self)
+        # Compiled format selectors by format specification
+        self._format_selectors = {}
+        # Compiled output templates by template
+        self._outtmpl_renderers = {}
+        self._download_archive = None
 
         if params.get('bidi_workaround', False):
             try:
@@ -546,26 +566,58 @@ class YoutubeDL(object):
         except UnicodeEncodeError:
             self.to_screen('[download] The file has already been downloaded')
 
+    def _compile_outtmpl(self, outtmpl):
+        """
+        Return a tuple of the expanded template and the set of fields it
+        references, or None as the set if the referenced fields cannot be
+        determined and the whole info dict has to be provided.
+        """
+        tmpl = compat_expanduser(outtmpl)
+        fields = set()
+        for m in re.finditer(r'%(?:(?P<percent>%)|\((?P<key>[^()]*)\)|)', tmpl):
+            if m.group('percent'):
+                continue
+            if m.group('key') is None:
+                # Positional or nested specifiers, let the % operator deal with them
+                return tmpl, None
+            fields.add(m.group('key'))
+        return tmpl, fields
+
     def prepare_filename(self, info_dict):
         """Generate the output filename."""
         try:
-            template_dict = dict(info_dict)
-
-            template_dict['epoch'] = int(time.time())
-            autonumber_size = self.params.get('autonumber_size')
-            if autonumber_size is None:
-                autonumber_size = 5
-            autonumber_templ = '%0' + str(autonumber_size) + 'd'
-            template_dict['autonumber'] = autonumber_templ % self._num_downloads
+            outtmpl = self.params.get('outtmpl', DEFAULT_OUTTMPL)
+            renderer = self._outtmpl_renderers.get(outtmpl)
+            if renderer is None:
+                renderer = self._outtmpl_renderers[outtmpl] = self._compile_outtmpl(outtmpl)
+            tmpl, fields = renderer
+
+            def referenced(field):
+                return fields is None or field in fields
+
+            if fields is None:
+                template_dict = dict(info_dict)
+            else:
+                template_dict = dict(
+                    (k, info_dict[k]) for k in fields if k in info_dict)
+
+            if referenced('epoch'):
+                template_dict['epoch'] = int(time.time())
+            if referenced('autonumber'):
+                autonumber_size = self.params.get('autonumber_size')
+                if autonumber_size is None:
+                    autonumber_size = 5
+                autonumber_templ = '%0' + str(autonumber_size) + 'd'
+                template_dict['autonumber'] = autonumber_templ % self._num_downloads
             if template_dict.get('playlist_index') is not None:
-                template_dict['playlist_index'] = '%0*d' % (len(str(template_dict['n_entries'])), template_dict['playlist_index'])
-            if template_dict.get('resolution') is None:
-                if template_dict.get('width') and template_dict.get('height'):
-                    template_dict['resolution'] = '%dx%d' % (template_dict['width'], template_dict['height'])
-                elif template_dict.get('height'):
-                    template_dict['resolution'] = '%sp' % template_dict['height']
-                elif template_dict.get('width'):
-                    template_dict['resolution'] = '?x%d' % template_dict['width']
+                template_dict['playlist_index'] = '%0*d' % (len(str(info_dict['n_entries'])), template_dict['playlist_index'])
+            if referenced('resolution') and template_dict.get('resolution') is None:
+                if info_dict.get('width') and info_dict.get('height'):
+                    template_dict['resolution'] = '%dx%d' % (info_dict['width'], info_dict['height'])
+                elif info_dict.get('height'):
+                    template_dict['resolution'] = '%sp' % info_dict['height']
+                elif info_dict.get('width'):
+                    template_dict['resolution'] = '?x%d' % info_dict['width']
 
             sanitize = lambda k, v: sanitize_filename(
                 compat_str(v),
@@ -574,10 +626,12 @@ class YoutubeDL(object):
             template_dict = dict((k, sanitize(k, v))
                                  for k, v in template_dict.items()
                                  if v is not None)
-            template_dict = collections.defaultdict(lambda: 'NA', template_dict)
+            if fields is None:
+                template_dict = collections.defaultdict(lambda: 'NA', template_dict)
+            else:
+                for k in fields:
+                    template_dict.setdefault(k, 'NA')
 
-            outtmpl = self.params.get('outtmpl', DEFAULT_OUTTMPL)
-            tmpl = compat_expanduser(outtmpl)
             filename = tmpl % template_dict
             # Temporary fix for #4787
             # 'Treat' all problem characters by passing filename through preferredencoding
@@ -661,35 +715,49 @@ class YoutubeDL(object):
                 self.report_warning('The program functionality for this site has been marked as broken, '
                                     'and will probably not work.')
 
-            try:
-                ie_result = ie.extract(url)
-                if ie_result is None:  # Finished already (backwards compatibility; listformats and friends should be moved here)
-                    break
-                if isinstance(ie_result, list):
-                    # Backwards compatibility: old IE result format
-                    ie_result = {
-                        '_type': 'compat_list',
-                        'entries': ie_result,
-                    }
-                self.add_default_extra_info(ie_result, ie, url)
-                if process:
-                    return self.process_ie_result(ie_result, download, extra_info)
-                else:
-                    return ie_result
-            except ExtractorError as e:  # An error we somewhat expected
-                self.report_error(compat_str(e), e.format_traceback())
-                break
-            except MaxDownloadsReached:
-                raise
-            except Exception as e:
-                if self.params.get('ignoreerrors', False):
-                    self.report_error(error_to_compat_str(e), tb=encode_compat_str(traceback.format_exc()))
-                    break
-                else:
-                    raise
+            return self._report_extraction_errors(
+                self._extract_with_ie, ie, url, download, extra_info, process)
         else:
             self.report_error('no suitable InfoExtractor for URL %s' % url)
 
+    def _extract_with_ie(self, ie, url, download, extra_info, process):
+        ie_result = self.extraction_cache.load(ie.ie_key(), url)
+        if ie_result is not None:
+            self.to_screen('[%s] %s: Using cached extraction result' % (ie.IE_NAME, ie_result.get('id')))
+        else:
+            ie_result = ie.extract(url)
+            if ie_result is None:  # Finished already (backwards compatibility; listformats and friends should be moved here)
+                return None
+            if isinstance(ie_result, list):
+                # Backwards compatibility: old IE result format
+                ie_result = {
+                    '_type': 'compat_list',
+                    'entries': ie_result,
+                }
+            self.add_default_extra_info(ie_result, ie, url)
+            self.extraction_cache.store(ie.ie_key(), url, ie_result)
+        if process:
+            return self.process_ie_result(ie_result, download, extra_info)
+        else:
+            return ie_result
+
+    def _report_extraction_errors(self, func, *args):
+        """ Call func(*args), reporting the errors expected while extracting
+
+        None is returned if an error was reported instead of raised.
+        """
+        try:
+            return func(*args)
+        except ExtractorError as e:  # An error we somewhat expected
+            self.report_error(compat_str(e), e.format_traceback())
+        except MaxDownloadsReached:
+            raise
+        except Exception as e:
+            if self.params.get('ignoreerrors', False):
+                self.report_error(error_to_compat_str(e), tb=encode_compat_str(traceback.format_exc()))
+            else:
+                raise
+
     def add_default_extra_info(self, ie_result, ie, url):
         self.add_extra_info(ie_result, {
             'extractor': ie.IE_NAME,
@@ -769,7 +837,7 @@ class YoutubeDL(object):
                                 yield int(item)
                         else:
                             yield int(string_segment)
-                playlistitems = iter_playlistitems(playlistitems_str)
+                playlistitems = list(iter_playlistitems(playlistitems_str))
 
             ie_entries = ie_result['entries']
             if isinstance(ie_entries, list):
@@ -786,11 +854,8 @@ class YoutubeDL(object):
                     (ie_result['extractor'], playlist, n_all_entries, n_entries))
             elif isinstance(ie_entries, PagedList):
                 if playlistitems:
-                    entries = []
-                    for item in playlistitems:
-                        entries.extend(ie_entries.getslice(
-                            item - 1, item
-                        ))
+                    entries = ie_entries.getitems(
+                        [item - 1 for item in playlistitems])
                 else:
                     entries = ie_entries.getslice(
                         playliststart, playlistend)
@@ -800,7 +865,13 @@ class YoutubeDL(object):
                     (ie_result['extractor'], playlist, n_entries))
             else:  # iterable
                 if playlistitems:
-                    entry_list = list(ie_entries)
+                    if min(playlistitems) < 1:
+                        # Indices counted from the end need all entries
+                        entry_list = list(ie_entries)
+                    else:
+                        # Entries past the last requested one are not needed
+                        entry_list = list(itertools.islice(
+                            ie_entries, max(playlistitems)))
                     entries = [entry_list[i - 1] for i in playlistitems]
                 else:
                     entries = list(itertools.islice(
@@ -913,10 +984,13 @@ class YoutubeDL(object):
         if not m:
             raise ValueError('Invalid filter specification %r' % filter_spec)
 
+        key = m.group('key')
+        none_inclusive = m.group('none_inclusive') is not None
+
         def _filter(f):
-            actual_value = f.get(m.group('key'))
+            actual_value = f.get(key)
             if actual_value is None:
-                return m.group('none_inclusive')
+                return none_inclusive
             return op(actual_value, comparison_value)
         return _filter
 
@@ -1050,6 +1124,11 @@ class YoutubeDL(object):
                     return []
             elif selector.type == SINGLE:
                 format_spec = selector.selector
+                extensions = ['mp4', 'flv', 'webm', '3gp', 'm4a', 'mp3', 'ogg', 'aac', 'wav']
+                if format_spec in extensions:
+                    filter_f = lambda f: f['ext'] == format_spec
+                else:
+                    filter_f = lambda f: f['format_id'] == format_spec
 
                 def selector_function(formats):
                     formats = list(formats)
@@ -1094,11 +1173,6 @@ class YoutubeDL(object):
                         if video_formats:
                             yield video_formats[0]
                     else:
-                        extensions = ['mp4', 'flv', 'webm', '3gp', 'm4a', 'mp3', 'ogg', 'aac', 'wav']
-                        if format_spec in extensions:
-                            filter_f = lambda f: f['ext'] == format_spec
-                        else:
-                            filter_f = lambda f: f['format_id'] == format_spec
                         matches = list(filter(filter_f, formats))
                         if matches:
                             yield matches[-1]
@@ -1148,10 +1222,13 @@ class YoutubeDL(object):
 
             filters = [self._build_format_filter(f) for f in selector.filters]
 
+            if not filters:
+                return selector_function
+
             def final_selector(formats):
-                for _filter in filters:
-                    formats = list(filter(_filter, formats))
-                return selector_function(formats)
+                return selector_function([
+                    f for f in formats
+                    if all(_filter(f) for _filter in filters)])
             return final_selector
 
         stream = io.BytesIO(format_spec.encode('utf-8'))
@@ -1332,7 +1409,9 @@ class YoutubeDL(object):
                     req_format_list.append('bestvideo+bestaudio')
             req_format_list.append('best')
             req_format = '/'.join(req_format_list)
-        format_selector = self.build_format_selector(req_format)
+        format_selector = self._format_selectors.get(req_format)
+        if format_selector is None:
+            format_selector = self._format_selectors[req_format] = self.build_format_selector(req_format)
         formats_to_download = list(format_selector(formats))
         if not formats_to_download:
             raise ExtractorError('requested format not available',
@@ -1494,38 +1573,6 @@ class YoutubeDL(object):
                     self.report_error('Cannot write annotations file: ' + annofn)
                     return
 
-        subtitles_are_requested = any([self.params.get('writesubtitles', False),
-                                       self.params.get('writeautomaticsub')])
-
-        if subtitles_are_requested and info_dict.get('requested_subtitles'):
-            # subtitles download errors are already managed as troubles in relevant IE
-            # that way it will silently go on when used with unsupporting IE
-            subtitles = info_dict['requested_subtitles']
-            ie = self.get_info_extractor(info_dict['extractor_key'])
-            for sub_lang, sub_info in subtitles.items():
-                sub_format = sub_info['ext']
-                if sub_info.get('data') is not None:
-                    sub_data = sub_info['data']
-                else:
-                    try:
-                        sub_data = ie._download_webpage(
-                            sub_info['url'], info_dict['id'], note=False)
-                    except ExtractorError as err:
-                        self.report_warning('Unable to download subtitle for "%s": %s' %
-                                            (sub_lang, error_to_compat_str(err.cause)))
-                        continue
-                try:
-                    sub_filename = subtitles_filename(filename, sub_lang, sub_format)
-                    if self.params.get('nooverwrites', False) and os.path.exists(encodeFilename(sub_filename)):
-                        self.to_screen('[info] Video subtitle %s.%s is already_present' % (sub_lang, sub_format))
-                    else:
-                        self.to_screen('[info] Writing video subtitles to: ' + sub_filename)
-                        with io.open(encodeFilename(sub_filename), 'w', encoding='utf-8') as subfile:
-                            subfile.write(sub_data)
-                except (OSError, IOError):
-                    self.report_error('Cannot write subtitles file ' + sub_filename)
-                    return
-
         if self.params.get('writeinfojson', False):
             infofn = replace_extension(filename, 'info.json', info_dict.get('ext'))
             if self.params.get('nooverwrites', False) and os.path.exists(encodeFilename(infofn)):
@@ -1538,9 +1585,15 @@ class YoutubeDL(object):
                     self.report_error('Cannot write metadata to JSON file ' + infofn)
                     return
 
-        self._write_thumbnails(info_dict, filename)
+        # A subtitle that cannot be written stops the download, so they are
+        # written first; thumbnails are downloaded while the media is
+        if self._write_subtitles(info_dict, filename) is False:
+            return
+        thumbnails_call = BackgroundCall(self._write_thumbnails, info_dict, filename)
 
-        if not self.params.get('skip_download', False):
+        if self.params.get('skip_download', False):
+            thumbnails_call.result()
+        else:
             try:
                 def dl(name, info):
                     fd = get_suitable_downloader(info, self.params)(self, self.params)
@@ -1615,6 +1668,10 @@ class YoutubeDL(object):
             except (ContentTooShortError, ) as err:
                 self.report_error('content too short (expected %s bytes and served %s)' % (err.expected, err.downloaded))
                 return
+            finally:
+                # Post processors may need the thumbnails. Errors writing them
+                # are raised on the paths that return early as well
+                thumbnails_call.result()
 
             if success:
                 # Fixup content
@@ -1670,11 +1727,35 @@ class YoutubeDL(object):
                 self.params.get('max_downloads') != 1):
             raise SameFileError(outtmpl)
 
-        for url in url_list:
+        force_generic_extractor = self.params.get('force_generic_extractor', False)
+        workers = self.params.get('concurrent_extractions') or 1
+        if workers > 1 and len(url_list) > 1:
+            # The next URLs are extracted while the current one is processed
+            # and downloaded
+            def extract(url):
+                return self.extract_info(
+                    url, download=False, process=False,
+                    force_generic_extractor=force_generic_extractor)
+
+            def download_extracted(ie_result):
+                if ie_result is not None:
+                    return self._report_extraction_errors(
+                        self.process_ie_result, ie_result, True, {})
+
+            downloads = (
+                functools.partial(download_extracted, ie_result)
+                for ie_result in parallel_map(extract, url_list, workers))
+        else:
+            downloads = (
+                functools.partial(
+                    self.extract_info, url,
+                    force_generic_extractor=force_generic_extractor)
+                for url in url_list)
+
+        for download_next in downloads:
             try:
                 # It also downloads the videos
-                res = self.extract_info(
-                    url, force_generic_extractor=self.params.get('force_generic_extractor', False))
+                res = download_next()
             except UnavailableVideoError:
                 self.report_error('unable to download video')
             except MaxDownloadsReached:
@@ -1742,33 +1823,32 @@ class YoutubeDL(object):
             return None  # Incomplete video information
         return extractor.lower() + ' ' + info_dict['id']
 
-    def in_download_archive(self, info_dict):
+    def _get_download_archive(self):
         fn = self.params.get('download_archive')
         if fn is None:
+            return None
+        if self._download_archive is None or self._download_archive.filename != fn:
+            self._download_archive = DownloadArchive(fn)
+        return self._download_archive
+
+    def in_download_archive(self, info_dict):
+        archive = self._get_download_archive()
+        if archive is None:
             return False
 
         vid_id = self._make_archive_id(info_dict)
         if vid_id is None:
             return False  # Incomplete video information
 
-        try:
-            with locked_file(fn, 'r', encoding='utf-8') as archive_file:
-                for line in archive_file:
-                    if line.strip() == vid_id:
-                        return True
-        except IOError as ioe:
-            if ioe.errno != errno.ENOENT:
-                raise
-        return False
+        return vid_id in archive
 
     def record_download_archive(self, info_dict):
-        fn = self.params.get('download_archive')
-        if fn is None:
+        archive = self._get_download_archive()
+        if archive is None:
             return
         vid_id = self._make_archive_id(info_dict)
         assert vid_id
-        with locked_file(fn, 'a', encoding='utf-8') as archive_file:
-            archive_file.write(vid_id + '\n')
+        archive.add(vid_id)
 
     @staticmethod
     def format_resolution(format, default='unknown'):
@@ -2007,6 +2087,46 @@ class YoutubeDL(object):
             encoding = preferredencoding()
         return encoding
 
+    def _write_subtitles(self, info_dict, filename):
+        """Download the requested subtitles, return False if one can't be written"""
+        subtitles_are_requested = any([self.params.get('writesubtitles', False),
+                                       self.params.get('writeautomaticsub')])
+        if not subtitles_are_requested or not info_dict.get('requested_subtitles'):
+            return
+
+        # subtitles download errors are already managed as troubles in relevant IE
+        # that way it will silently go on when used with unsupporting IE
+        subtitles = info_dict['requested_subtitles']
+        ie = self.get_info_extractor(info_dict['extractor_key'])
+
+        def write_subtitle(subtitle):
+            sub_lang, sub_info = subtitle
+            sub_format = sub_info['ext']
+            if sub_info.get('data') is not None:
+                sub_data = sub_info['data']
+            else:
+                try:
+                    sub_data = ie._download_webpage(
+                        sub_info['url'], info_dict['id'], note=False)
+                except ExtractorError as err:
+                    self.report_warning('Unable to download subtitle for "%s": %s' %
+                                        (sub_lang, error_to_compat_str(err.cause)))
+                    return True
+            try:
+                sub_filename = subtitles_filename(filename, sub_lang, sub_format)
+                if self.params.get('nooverwrites', False) and os.path.exists(encodeFilename(sub_filename)):
+                    self.to_screen('[info] Video subtitle %s.%s is already_present' % (sub_lang, sub_format))
+                else:
+                    self.to_screen('[info] Writing video subtitles to: ' + sub_filename)
+                    with io.open(encodeFilename(sub_filename), 'w', encoding='utf-8') as subfile:
+                        subfile.write(sub_data)
+            except (OSError, IOError):
+                self.report_error('Cannot write subtitles file ' + sub_filename)
+                return False
+            return True
+
+        return all(list(parallel_map(write_subtitle, subtitles.items(), self._SIDECAR_DOWNLOAD_WORKERS)))
+
     def _write_thumbnails(self, info_dict, filename):
         if self.params.get('writethumbnail', False):
             thumbnails = info_dict.get('thumbnails')
@@ -2021,7 +2141,7 @@ class YoutubeDL(object):
             # No thumbnails present, so return immediately
             return
 
-        for t in thumbnails:
+        def write_thumbnail(t):
             thumb_ext = determine_ext(t['url'], 'jpg')
             suffix = '_%s' % t['id'] if len(thumbnails) > 1 else ''
             thumb_display_id = '%s ' % t['id'] if len(thumbnails) > 1 else ''
@@ -2042,3 +2162,5 @@ class YoutubeDL(object):
                 except (compat_urllib_error.URLError, compat_http_client.HTTPException, socket.error) as err:
                     self.report_warning('Unable to download thumbnail "%s": %s' %
                                         (t['url'], error_to_compat_str(err)))
+
+        list(parallel_map(write_thumbnail, thumbnails, self._SIDECAR_DOWNLOAD_WORKERS))
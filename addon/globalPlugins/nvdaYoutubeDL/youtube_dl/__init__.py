@@ -134,6 +134,11 @@ def _real_main(argv=None):
         if numeric_limit is None:
             parser.error('invalid rate limit specified')
         opts.ratelimit = numeric_limit
+    if opts.ratelimit_burst is not None:
+        numeric_limit = FileDownloader.parse_bytes(opts.ratelimit_burst)
+        if numeric_limit is None:
+            parser.error('invalid rate limit burst specified')
+        opts.ratelimit_burst = numeric_limit
     if opts.min_filesize is not None:
         numeric_limit = FileDownloader.parse_bytes(opts.min_filesize)
         if numeric_limit is None:
@@ -297,7 +302,9 @@ def _real_main(argv=None):
         'restrictfilenames': opts.restrictfilenames,
         'ignoreerrors': opts.ignoreerrors,
         'force_generic_extractor': opts.force_generic_extractor,
+        'concurrent_extractions': opts.concurrent_extractions,
         'ratelimit': opts.ratelimit,
+        'ratelimit_burst': opts.ratelimit_burst,
         'nooverwrites': opts.nooverwrites,
         'retries': opts_retries,
         'buffersize': opts.buffersize,
@@ -339,6 +346,7 @@ def _real_main(argv=None):
         'max_views': opts.max_views,
         'daterange': date,
         'cachedir': opts.cachedir,
+        'extraction_cache_ttl': opts.extraction_cache_ttl,
         'youtube_print_sig_code': opts.youtube_print_sig_code,
         'age_limit': opts.age_limit,
         'download_archive': download_archive_fn,
@@ -365,10 +373,13 @@ def _real_main(argv=None):
         'list_thumbnails': opts.list_thumbnails,
         'playlist_items': opts.playlist_items,
         'xattr_set_filesize': opts.xattr_set_filesize,
+        'preallocate': opts.preallocate,
         'match_filter': match_filter,
         'no_color': opts.no_color,
         'ffmpeg_location': opts.ffmpeg_location,
         'hls_prefer_native': opts.hls_prefer_native,
+        'hls_adaptive_max_eta': opts.hls_adaptive_max_eta,
+        'concurrent_fragment_downloads': opts.concurrent_fragment_downloads,
         'external_downloader_args': external_downloader_args,
         'postprocessor_args': postprocessor_args,
         'cn_verification_proxy': opts.cn_verification_proxy,
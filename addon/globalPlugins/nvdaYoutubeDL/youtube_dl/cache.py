@@ -1,11 +1,16 @@
 from __future__ import unicode_literals
 
+import collections
+import copy
 import errno
+import hashlib
 import io
 import json
 import os
 import re
 import shutil
+import threading
+import time
 import traceback
 
 from .compat import compat_expanduser, compat_getenv
@@ -91,3 +96,88 @@ class Cache(object):
             self._ydl.to_screen('.', skip_eol=True)
             shutil.rmtree(cachedir)
         self._ydl.to_screen('.')
+
+
+class ExtractionCache(object):
+    """Extraction results by extractor and URL, kept in memory and in the Cache
+
+    Results are kept for extraction_cache_ttl seconds at most, and dropped
+    earlier if one of their media URLs carries an "expire" timestamp, as
+    the signed URLs of YouTube do. At most _MEMORY_SIZE results are kept in
+    memory; the least recently used ones are dropped from memory first.
+    """
+
+    _SECTION = 'extraction'
+    # Seconds before the expiry of a media URL at which a result is dropped
+    _EXPIRY_MARGIN = 60
+    _MEMORY_SIZE = 100
+
+    def __init__(self, ydl):
+        self._ydl = ydl
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self._ydl.params.get('extraction_cache_ttl'))
+
+    @staticmethod
+    def _get_key(ie_key, url):
+        return hashlib.sha1(('%s %s' % (ie_key, url)).encode('utf-8')).hexdigest()
+
+    def _get_expiry(self, ie_result):
+        expires = time.time() + self._ydl.params['extraction_cache_ttl']
+        urls = [ie_result.get('url')] + [f.get('url') for f in ie_result.get('formats') or []]
+        for url in urls:
+            if not url:
+                continue
+            mobj = re.search(r'[?&/]expire[=/](\d+)', url)
+            if mobj:
+                expires = min(expires, int(mobj.group(1)) - self._EXPIRY_MARGIN)
+        return expires
+
+    def load(self, ie_key, url):
+        if not self.enabled:
+            return None
+        key = self._get_key(ie_key, url)
+        with self._lock:
+            entry = self._memory.pop(key, None)
+        if entry is None:
+            entry = self._ydl.cache.load(self._SECTION, key)
+        if not entry or entry.get('expires', 0) <= time.time():
+            return None
+        self._remember(key, entry)
+        # The result is modified while it is processed
+        return copy.deepcopy(entry['ie_result'])
+
+    def store(self, ie_key, url, ie_result):
+        # Playlists may contain generators and are cheap to resolve again
+        if not self.enabled or ie_result.get('_type', 'video') != 'video':
+            return
+        expires = self._get_expiry(ie_result)
+        if expires <= time.time():
+            return
+        key = self._get_key(ie_key, url)
+        entry = {
+            'expires': expires,
+            'ie_result': copy.deepcopy(ie_result),
+        }
+        self._remember(key, entry)
+        try:
+            json.dumps(entry)
+        except (TypeError, ValueError):
+            # Not serializable, only keep it in memory
+            return
+        self._ydl.cache.store(self._SECTION, key, entry)
+
+    def _remember(self, key, entry):
+        """Keep entry in memory as the most recently used one"""
+        now = time.time()
+        with self._lock:
+            for old_key, old_entry in list(self._memory.items()):
+                if old_entry['expires'] <= now:
+                    del self._memory[old_key]
+            self._memory.pop(key, None)
+            self._memory[key] = entry
+            while len(self._memory) > self._MEMORY_SIZE:
+                self._memory.popitem(last=False)
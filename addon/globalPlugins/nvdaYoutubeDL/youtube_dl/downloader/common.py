@@ -3,6 +3,7 @@ from __future__ import division, unicode_literals
 import os
 import re
 import sys
+import threading
 import time
 
 from ..utils import (
@@ -14,6 +15,47 @@ from ..utils import (
 )
 
 
+class RateLimiter(object):
+    """Token bucket limiting the bandwidth of several downloads together.
+
+    Every caller of consume() takes its bytes from the bucket immediately,
+    even if that drives the balance negative, and then sleeps until the
+    balance is paid back. Concurrent downloads therefore wait in the order
+    they read their data and share the rate fairly. Up to burst bytes may be
+    consumed without waiting after an idle period.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, byte_count):
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= byte_count
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(rate, burst=None):
+    """Return the process-wide RateLimiter for the given rate and burst"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get((rate, burst))
+        if limiter is None:
+            limiter = _rate_limiters[(rate, burst)] = RateLimiter(rate, burst)
+        return limiter
+
+
 class FileDownloader(object):
     """File Downloader class.
 
@@ -28,7 +70,10 @@ class FileDownloader(object):
 
     verbose:            Print additional info to stdout.
     quiet:              Do not print messages to stdout.
-    ratelimit:          Download speed limit, in bytes/sec.
+    ratelimit:          Download speed limit, in bytes/sec. The limit applies
+                        to all downloads in the process together.
+    ratelimit_burst:    Number of bytes that may be downloaded at full speed
+                        before ratelimit applies (default: one second worth).
     retries:            Number of times to retry for HTTP error 5xx
     buffersize:         Size of download buffer in bytes.
     noresizebuffer:     Do not automatically resize the download buffer.
@@ -43,6 +88,15 @@ class FileDownloader(object):
     max_filesize:       Skip files larger than this size
     xattr_set_filesize: Set ytdl.filesize user xattribute with expected size.
                         (experimental)
+    hls_adaptive_max_eta: With the native HLS downloader, switch between the
+                        renditions of a video to keep the estimated time to
+                        completion under this many seconds. The switches
+                        are recorded in info_dict['hls_adaptive_switches']
+                        during the download.
+    preallocate:        Reserve disk space for the whole file before writing
+                        when its size is known in advance.
+    concurrent_fragment_downloads: Number of DASH fragments to download at
+                        once (default: 1).
     external_downloader_args:  A list of additional command-line arguments for the
                         external downloader.
 
@@ -154,19 +208,12 @@ class FileDownloader(object):
     def report_error(self, *args, **kargs):
         self.ydl.report_error(*args, **kargs)
 
-    def slow_down(self, start_time, now, byte_counter):
-        """Sleep if the download speed is over the rate limit."""
+    def slow_down(self, byte_count):
+        """Sleep if downloading byte_count more bytes exceeds the rate limit."""
         rate_limit = self.params.get('ratelimit', None)
-        if rate_limit is None or byte_counter == 0:
-            return
-        if now is None:
-            now = time.time()
-        elapsed = now - start_time
-        if elapsed <= 0.0:
+        if rate_limit is None or byte_count == 0:
             return
-        speed = float(byte_counter) / elapsed
-        if speed > rate_limit:
-            time.sleep(max((byte_counter // rate_limit) - elapsed, 0))
+        get_rate_limiter(rate_limit, self.params.get('ratelimit_burst')).consume(byte_count)
 
     def temp_name(self, filename):
         """Returns a temporary filename for the given filename."""
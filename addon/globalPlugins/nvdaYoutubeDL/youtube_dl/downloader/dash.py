@@ -1,66 +1,85 @@
 from __future__ import unicode_literals
 
+import os
 import re
 
-from .common import FileDownloader
-from ..utils import sanitized_Request
+from .fragment import FragmentFD
+from ..utils import (
+    encodeFilename,
+    parallel_map,
+    sanitize_open,
+)
 
 
-class DashSegmentsFD(FileDownloader):
+class DashSegmentsFD(FragmentFD):
     """
     Download segments in a DASH manifest
     """
+
+    FD_NAME = 'dashsegments'
+
     def real_download(self, filename, info_dict):
-        self.report_destination(filename)
-        tmpfilename = self.temp_name(filename)
         base_url = info_dict['url']
         segment_urls = info_dict['segment_urls']
-
-        is_test = self.params.get('test', False)
-        remaining_bytes = self._TEST_FILE_SIZE if is_test else None
-        byte_counter = 0
-
-        def append_url_to_file(outf, target_url, target_name, remaining_bytes=None):
-            self.to_screen('[DashSegments] %s: Downloading %s' % (info_dict['id'], target_name))
-            req = sanitized_Request(target_url)
-            if remaining_bytes is not None:
-                req.add_header('Range', 'bytes=0-%d' % (remaining_bytes - 1))
-
-            data = self.ydl.urlopen(req).read()
-
-            if remaining_bytes is not None:
-                data = data[:remaining_bytes]
-
-            outf.write(data)
-            return len(data)
+        if self.params.get('test', False):
+            # We only download the first segment during the test
+            segment_urls = segment_urls[:1]
 
         def combine_url(base_url, target_url):
             if re.match(r'^https?://', target_url):
                 return target_url
             return '%s%s%s' % (base_url, '' if base_url.endswith('/') else '/', target_url)
 
-        with open(tmpfilename, 'wb') as outf:
-            append_url_to_file(
-                outf, combine_url(base_url, info_dict['initialization_url']),
-                'initialization segment')
-            for i, segment_url in enumerate(segment_urls):
-                segment_len = append_url_to_file(
-                    outf, combine_url(base_url, segment_url),
-                    'segment %d / %d' % (i + 1, len(segment_urls)),
-                    remaining_bytes)
-                byte_counter += segment_len
-                if remaining_bytes is not None:
-                    remaining_bytes -= segment_len
-                    if remaining_bytes <= 0:
-                        break
-
-        self.try_rename(tmpfilename, filename)
-
-        self._hook_progress({
-            'downloaded_bytes': byte_counter,
-            'total_bytes': byte_counter,
+        # The initialization segment is stored as the first fragment
+        fragments = [(info_dict['initialization_url'], 'Init')]
+        fragments.extend(
+            (segment_url, 'Seg%d' % i) for i, segment_url in enumerate(segment_urls))
+
+        ctx = {
             'filename': filename,
-            'status': 'finished',
-        })
+            'total_frags': len(fragments),
+        }
+
+        self._prepare_and_start_frag_download(ctx)
+
+        workers = self.params.get('concurrent_fragment_downloads') or 1
+
+        def download_fragment(fragment):
+            target_url, target_name = fragment
+            target_filename = '%s-%s' % (ctx['tmpfilename'], target_name)
+            if workers > 1:
+                dl = self._create_quiet_downloader()
+                dl.add_progress_hook(ctx['frag_progress_hook'])
+            else:
+                dl = ctx['dl']
+            success = dl.download(target_filename, {'url': combine_url(base_url, target_url)})
+            if not success:
+                return None
+            down, target_sanitized = sanitize_open(target_filename, 'rb')
+            frag_content = down.read()
+            down.close()
+            os.remove(encodeFilename(target_sanitized))
+            return frag_content
+
+        pending = fragments[ctx['fragment_index']:]
+        if workers > 1:
+            # Fragments are still appended in order, so at most workers
+            # fragments are held in memory
+            frag_contents = parallel_map(
+                download_fragment, pending, workers, wait_on_close=True)
+        else:
+            frag_contents = (download_fragment(fragment) for fragment in pending)
+
+        try:
+            for frag_content in frag_contents:
+                if frag_content is None:
+                    return False
+                self._append_fragment(ctx, frag_content)
+        finally:
+            # Wait for the fragments still being downloaded, which remove
+            # their files once they are complete
+            frag_contents.close()
+
+        self._finish_frag_download(ctx)
 
         return True
@@ -1,6 +1,9 @@
 from __future__ import division, unicode_literals
 
+import io
+import json
 import os
+import threading
 import time
 
 from .common import FileDownloader
@@ -8,6 +11,7 @@ from .http import HttpFD
 from ..utils import (
     encodeFilename,
     sanitize_open,
+    write_json_file,
 )
 
 
@@ -19,8 +23,50 @@ class HttpQuietDownloader(HttpFD):
 class FragmentFD(FileDownloader):
     """
     A base file downloader class for fragmented media (e.g. f4m/m3u8 manifests).
+
+    Progress is recorded in a .ytdl file next to the temporary file after
+    each fragment, so that an interrupted download continues from the last
+    complete fragment. Subclasses should skip the first ctx['fragment_index']
+    fragments and pass each downloaded fragment to _append_fragment. A
+    subclass that may switch to another rendition of the media keeps its
+    format id in ctx['rendition'], which is recorded along with the progress.
     """
 
+    @staticmethod
+    def ytdl_filename(filename):
+        return filename + '.ytdl'
+
+    def _read_ytdl_file(self, ctx):
+        try:
+            with io.open(encodeFilename(self.ytdl_filename(ctx['tmpfilename'])), 'r', encoding='utf-8') as ytdl_file:
+                frag_state = json.load(ytdl_file)['downloader']
+            return int(frag_state['fragment_index']), int(frag_state['offset']), frag_state.get('rendition')
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_ytdl_file(self, ctx):
+        frag_state = {
+            'fragment_index': ctx['fragment_index'],
+            'offset': ctx['dest_stream'].tell(),
+        }
+        if ctx.get('rendition') is not None:
+            frag_state['rendition'] = ctx['rendition']
+        write_json_file({
+            'downloader': frag_state,
+        }, self.ytdl_filename(ctx['tmpfilename']))
+
+    def _append_fragment(self, ctx, frag_content):
+        """Write a complete fragment to the destination and record it"""
+        ctx['dest_stream'].write(frag_content)
+        ctx['fragment_index'] += 1
+        self._record_frag_state(ctx)
+
+    def _record_frag_state(self, ctx):
+        """Record the progress in ctx so that the download can be resumed"""
+        if not ctx.get('live') and ctx['tmpfilename'] != '-':
+            ctx['dest_stream'].flush()
+            self._write_ytdl_file(ctx)
+
     def _prepare_and_start_frag_download(self, ctx):
         self._prepare_frag_download(ctx)
         self._start_frag_download(ctx)
@@ -28,76 +74,116 @@ class FragmentFD(FileDownloader):
     def _prepare_frag_download(self, ctx):
         self.to_screen('[%s] Total fragments: %d' % (self.FD_NAME, ctx['total_frags']))
         self.report_destination(ctx['filename'])
-        dl = HttpQuietDownloader(
+        ctx.update({
+            'dl': self._create_quiet_downloader(),
+            'tmpfilename': self.temp_name(ctx['filename']),
+            'fragment_index': 0,
+            'resume_len': 0,
+            'rendition': None,
+        })
+
+        open_mode = 'wb'
+        resume_state = None
+        if (self.params.get('continuedl', True) and not ctx.get('live') and
+                ctx['tmpfilename'] != '-' and
+                os.path.isfile(encodeFilename(ctx['tmpfilename']))):
+            resume_state = self._read_ytdl_file(ctx)
+            # The temporary file may be longer than recorded if the download
+            # was interrupted while a fragment was being written
+            if (resume_state is not None and
+                    resume_state[1] <= os.path.getsize(encodeFilename(ctx['tmpfilename']))):
+                open_mode = 'r+b'
+            else:
+                resume_state = None
+
+        dest_stream, ctx['tmpfilename'] = sanitize_open(ctx['tmpfilename'], open_mode)
+        ctx['dest_stream'] = dest_stream
+        if resume_state is not None:
+            ctx['fragment_index'], ctx['resume_len'], ctx['rendition'] = resume_state
+            dest_stream.seek(ctx['resume_len'])
+            dest_stream.truncate()
+            self.to_screen('[%s] Resuming download at fragment %d' % (self.FD_NAME, ctx['fragment_index'] + 1))
+
+    def _create_quiet_downloader(self):
+        """
+        Create a downloader for fragments. Fragments downloaded concurrently
+        each need their own one, with ctx['frag_progress_hook'] added.
+        """
+        return HttpQuietDownloader(
             self.ydl,
             {
                 'continuedl': True,
                 'quiet': True,
                 'noprogress': True,
                 'ratelimit': self.params.get('ratelimit', None),
+                'ratelimit_burst': self.params.get('ratelimit_burst', None),
                 'retries': self.params.get('retries', 0),
                 'test': self.params.get('test', False),
             }
         )
-        tmpfilename = self.temp_name(ctx['filename'])
-        dest_stream, tmpfilename = sanitize_open(tmpfilename, 'wb')
-        ctx.update({
-            'dl': dl,
-            'dest_stream': dest_stream,
-            'tmpfilename': tmpfilename,
-        })
 
     def _start_frag_download(self, ctx):
-        total_frags = ctx['total_frags']
         # This dict stores the download progress, it's updated by the progress
         # hook
         state = {
             'status': 'downloading',
-            'downloaded_bytes': 0,
-            'frag_index': 0,
-            'frag_count': total_frags,
+            'downloaded_bytes': ctx['resume_len'],
+            'frag_index': ctx['fragment_index'],
+            'frag_count': ctx['total_frags'],
             'filename': ctx['filename'],
             'tmpfilename': ctx['tmpfilename'],
         }
         start = time.time()
         ctx['started'] = start
+        # Fragments may be downloaded concurrently, each by its own
+        # downloader; the hook keeps the (downloaded bytes, total bytes,
+        # speed) of each fragment in progress, by file name, and updates
+        # state under the lock
+        lock = threading.Lock()
+        active_frags = {}
 
         def frag_progress_hook(s):
             if s['status'] not in ('downloading', 'finished'):
                 return
 
-            frag_total_bytes = s.get('total_bytes', 0)
-            if s['status'] == 'finished':
-                state['downloaded_bytes'] += frag_total_bytes
-                state['frag_index'] += 1
-
-            estimated_size = (
-                (state['downloaded_bytes'] + frag_total_bytes) /
-                (state['frag_index'] + 1) * total_frags)
-            time_now = time.time()
-            state['total_bytes_estimate'] = estimated_size
-            state['elapsed'] = time_now - start
-
-            if s['status'] == 'finished':
-                progress = self.calc_percent(state['frag_index'], total_frags)
-            else:
-                frag_downloaded_bytes = s['downloaded_bytes']
-                frag_progress = self.calc_percent(frag_downloaded_bytes,
-                                                  frag_total_bytes)
-                progress = self.calc_percent(state['frag_index'], total_frags)
-                progress += frag_progress / float(total_frags)
-
-                state['eta'] = self.calc_eta(
-                    start, time_now, estimated_size, state['downloaded_bytes'] + frag_downloaded_bytes)
-                state['speed'] = s.get('speed')
-            self._hook_progress(state)
-
+            with lock:
+                # The number of fragments grows while a live stream is recorded
+                total_frags = ctx['total_frags']
+                state['frag_count'] = total_frags
+
+                if s['status'] == 'finished':
+                    active_frags.pop(s['filename'], None)
+                    state['downloaded_bytes'] += s.get('total_bytes') or 0
+                    state['frag_index'] += 1
+                else:
+                    active_frags[s['filename']] = (
+                        s['downloaded_bytes'], s.get('total_bytes') or 0, s.get('speed'))
+
+                active_downloaded_bytes = sum(f[0] for f in active_frags.values())
+                estimated_size = (
+                    (state['downloaded_bytes'] + sum(f[1] for f in active_frags.values())) /
+                    max(state['frag_index'] + len(active_frags), 1) * total_frags)
+                time_now = time.time()
+                state['total_bytes_estimate'] = estimated_size
+                state['elapsed'] = time_now - start
+
+                if s['status'] == 'downloading':
+                    state['eta'] = self.calc_eta(
+                        start, time_now, estimated_size, state['downloaded_bytes'] + active_downloaded_bytes)
+                    speeds = [f[2] for f in active_frags.values() if f[2] is not None]
+                    state['speed'] = sum(speeds) if speeds else None
+                self._hook_progress(state)
+
+        ctx['frag_progress_hook'] = frag_progress_hook
         ctx['dl'].add_progress_hook(frag_progress_hook)
 
         return start
 
     def _finish_frag_download(self, ctx):
         ctx['dest_stream'].close()
+        ytdl_filename = encodeFilename(self.ytdl_filename(ctx['tmpfilename']))
+        if os.path.isfile(ytdl_filename):
+            os.remove(ytdl_filename)
         elapsed = time.time() - ctx['started']
         self.try_rename(ctx['tmpfilename'], ctx['filename'])
         fsize = os.path.getsize(encodeFilename(ctx['filename']))
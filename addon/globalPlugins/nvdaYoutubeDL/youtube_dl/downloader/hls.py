@@ -1,17 +1,24 @@
-from __future__ import unicode_literals
+from __future__ import division, unicode_literals
 
 import os
 import re
 import subprocess
+import time
 
 from .common import FileDownloader
 from .fragment import FragmentFD
 
-from ..compat import compat_urlparse
+from ..compat import (
+    compat_urllib_error,
+    compat_urlparse,
+)
 from ..postprocessor.ffmpeg import FFmpegPostProcessor
 from ..utils import (
     encodeArgument,
     encodeFilename,
+    error_to_compat_str,
+    float_or_none,
+    int_or_none,
     sanitize_open,
     handle_youtubedl_headers,
 )
@@ -64,51 +71,309 @@ class HlsFD(FileDownloader):
             return False
 
 
+class HlsRenditionSwitcher(object):
+    """
+    Chooses between aligned renditions of an HLS stream from the measured
+    download throughput, so that the estimated time to completion stays
+    under max_eta seconds. The format id of the rendition in use is kept in
+    ctx['rendition'] so that an interrupted download resumes with it.
+    """
+
+    # Number of fragments to measure before considering another switch
+    _MIN_SAMPLES = 2
+    # Weight of the latest fragment in the throughput estimate
+    _SMOOTHING = 0.3
+    # Only switch to a higher bitrate if it would finish within this
+    # fraction of max_eta
+    _UPSWITCH_MARGIN = 0.8
+
+    def __init__(self, fd, ctx, info_dict, current, renditions, total_frags, max_eta):
+        self.fd = fd
+        self.ctx = ctx
+        self.info_dict = info_dict
+        self.renditions = renditions
+        self.current = current
+        self.total_frags = total_frags
+        self.max_eta = max_eta
+        self.throughput = None
+        self.bytes_per_tbr = None
+        self.samples = 0
+        self._playlists = {}
+        self._misaligned = set()
+
+    def fragment_url(self, frag_index, default_url):
+        playlist = self._playlists.get(self.current['format_id'])
+        if playlist is None:
+            return default_url
+        return playlist[frag_index]
+
+    def resume(self, format_id):
+        """Continue with the rendition an interrupted download had switched
+        to, return True on success."""
+        for rendition in self.renditions:
+            if rendition['format_id'] == format_id and self._load_playlist(rendition):
+                self.current = rendition
+                self.ctx['rendition'] = format_id
+                return True
+        return False
+
+    def report_fragment(self, frag_index, frag_size, elapsed):
+        if not self.max_eta or elapsed < 0.001 or not frag_size:
+            return
+        throughput = frag_size / elapsed
+        bytes_per_tbr = float(frag_size) / self.current['tbr']
+        if self.throughput is None:
+            self.throughput = throughput
+            self.bytes_per_tbr = bytes_per_tbr
+        else:
+            self.throughput += self._SMOOTHING * (throughput - self.throughput)
+            self.bytes_per_tbr += self._SMOOTHING * (bytes_per_tbr - self.bytes_per_tbr)
+        self.samples += 1
+        if self.samples >= self._MIN_SAMPLES:
+            self._select(frag_index + 1)
+
+    def _eta(self, rendition, remaining_frags):
+        return remaining_frags * self.bytes_per_tbr * rendition['tbr'] / self.throughput
+
+    def _select(self, next_frag_index):
+        remaining_frags = self.total_frags - next_frag_index
+        if remaining_frags <= 0:
+            return
+        candidates = [
+            r for r in self.renditions
+            if r['format_id'] not in self._misaligned]
+        best = None
+        for rendition in candidates:
+            max_eta = self.max_eta
+            if rendition['tbr'] > self.current['tbr']:
+                max_eta *= self._UPSWITCH_MARGIN
+            if self._eta(rendition, remaining_frags) <= max_eta:
+                best = rendition
+        if best is None:
+            best = candidates[0]
+        if best is self.current or not self._load_playlist(best):
+            return
+        self.fd.to_screen(
+            '[%s] Switching to format %s (%dk) at fragment %d' % (
+                self.fd.FD_NAME, best['format_id'], best['tbr'], next_frag_index + 1))
+        self.info_dict.setdefault('hls_adaptive_switches', []).append({
+            'format_id': best['format_id'],
+            'tbr': best['tbr'],
+            'fragment': next_frag_index,
+        })
+        self.ctx['rendition'] = best['format_id']
+        # Fragments left over by an interruption from now on belong to the
+        # new rendition
+        self.fd._record_frag_state(self.ctx)
+        self.current = best
+        self.samples = 0
+
+    def _load_playlist(self, rendition):
+        format_id = rendition['format_id']
+        if format_id in self._playlists:
+            return True
+        try:
+            playlist = self.fd._download_media_playlist(rendition['url'])
+        except compat_urllib_error.URLError as err:
+            self.fd.report_warning(
+                'Unable to download playlist of format %s: %s' % (format_id, error_to_compat_str(err)))
+            self._misaligned.add(format_id)
+            return False
+        if len(playlist['fragments']) != self.total_frags:
+            self.fd.report_warning(
+                'Format %s is not aligned with the current format, not switching to it' % format_id)
+            self._misaligned.add(format_id)
+            return False
+        self._playlists[format_id] = [frag_url for _, frag_url in playlist['fragments']]
+        return True
+
+
 class NativeHlsFD(FragmentFD):
-    """ A more limited implementation that does not require ffmpeg """
+    """ A more limited implementation that does not require ffmpeg
 
-    FD_NAME = 'hlsnative'
+    Live streams (info_dict['is_live']) whose media playlist has no
+    #EXT-X-ENDLIST are recorded: the playlist is polled every target
+    duration and new segments are appended by media sequence number until
+    the stream ends or the download is interrupted. Other playlists are
+    downloaded as listed, even if #EXT-X-ENDLIST is missing.
 
-    def real_download(self, filename, info_dict):
-        man_url = info_dict['url']
-        self.to_screen('[%s] Downloading m3u8 manifest' % self.FD_NAME)
-        manifest = self.ydl.urlopen(man_url).read()
+    With the hls_adaptive_max_eta option, the downloader may switch to other
+    renditions from info_dict['formats'] of the same video when the measured
+    throughput cannot finish the download in time. Each switch is appended
+    to info_dict['hls_adaptive_switches'] as a dict with the format_id and
+    tbr switched to and the (0-based) fragment it applies from. The info
+    JSON is written before the download, so the field is only available to
+    post processors and to callers of the info dict after the download.
+    """
 
-        s = manifest.decode('utf-8', 'ignore')
-        fragment_urls = []
+    FD_NAME = 'hlsnative'
+    # Stop recording a live stream after this many polls without new segments
+    _LIVE_MAX_IDLE_POLLS = 10
+
+    def _download_media_playlist(self, man_url):
+        urlh = self.ydl.urlopen(man_url)
+        s = urlh.read().decode('utf-8', 'ignore')
+        base_url = urlh.geturl()
+        media_sequence = 0
+        playlist = {
+            'target_duration': None,
+            'ended': False,
+            'fragments': [],
+        }
         for line in s.splitlines():
             line = line.strip()
-            if line and not line.startswith('#'):
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                media_sequence = int_or_none(line[len('#EXT-X-MEDIA-SEQUENCE:'):], default=0)
+            elif line.startswith('#EXT-X-TARGETDURATION:'):
+                playlist['target_duration'] = float_or_none(line[len('#EXT-X-TARGETDURATION:'):])
+            elif line == '#EXT-X-ENDLIST':
+                playlist['ended'] = True
+            elif line and not line.startswith('#'):
                 segment_url = (
                     line
                     if re.match(r'^https?://', line)
-                    else compat_urlparse.urljoin(man_url, line))
-                fragment_urls.append(segment_url)
-                # We only download the first fragment during the test
-                if self.params.get('test', False):
-                    break
+                    else compat_urlparse.urljoin(base_url, line))
+                playlist['fragments'].append((media_sequence, segment_url))
+                media_sequence += 1
+        return playlist
+
+    def _build_rendition_switcher(self, info_dict, ctx, total_frags):
+        # A download resumed after a switch needs the switcher to continue
+        # with the same rendition, even without hls_adaptive_max_eta
+        max_eta = self.params.get('hls_adaptive_max_eta')
+        if not (max_eta or ctx['rendition']) or not info_dict.get('tbr'):
+            return None
+
+        def media_type(f):
+            return (f.get('vcodec') == 'none', f.get('acodec') == 'none')
+
+        current = None
+        renditions = []
+        for f in info_dict.get('formats') or []:
+            if (f.get('protocol') not in ('m3u8', 'm3u8_native') or not f.get('tbr') or
+                    media_type(f) != media_type(info_dict)):
+                continue
+            if f.get('format_id') == info_dict.get('format_id'):
+                current = f
+            renditions.append(f)
+        if current is None or len(renditions) < 2:
+            return None
+        renditions.sort(key=lambda f: f['tbr'])
+        return HlsRenditionSwitcher(self, ctx, info_dict, current, renditions, total_frags, max_eta)
+
+    def real_download(self, filename, info_dict):
+        man_url = info_dict['url']
+        self.to_screen('[%s] Downloading m3u8 manifest' % self.FD_NAME)
+        playlist = self._download_media_playlist(man_url)
+
+        fragments = playlist['fragments']
+        is_test = self.params.get('test', False)
+        if is_test:
+            # We only download the first fragment during the test
+            fragments = fragments[:1]
+        live = bool(info_dict.get('is_live')) and not playlist['ended'] and not is_test
 
         ctx = {
             'filename': filename,
-            'total_frags': len(fragment_urls),
+            'total_frags': len(fragments),
+            'live': live,
         }
 
-        self._prepare_and_start_frag_download(ctx)
+        self._prepare_frag_download(ctx)
 
-        frags_filenames = []
-        for i, frag_url in enumerate(fragment_urls):
-            frag_filename = '%s-Frag%d' % (ctx['tmpfilename'], i)
-            success = ctx['dl'].download(frag_filename, {'url': frag_url})
-            if not success:
-                return False
-            down, frag_sanitized = sanitize_open(frag_filename, 'rb')
-            ctx['dest_stream'].write(down.read())
-            down.close()
-            frags_filenames.append(frag_sanitized)
+        switcher = None
+        if not live and not is_test:
+            switcher = self._build_rendition_switcher(info_dict, ctx, len(fragments))
+        if ctx['rendition'] is not None and ctx['rendition'] != info_dict.get('format_id'):
+            # The interrupted download had switched to another rendition,
+            # whose fragments the rest of the file has to come from
+            if switcher is None or not switcher.resume(ctx['rendition']):
+                self.report_warning(
+                    'Unable to continue with format %s, restarting the download' % ctx['rendition'])
+                # The next fragment may have been downloaded before the
+                # interruption, from the rendition that cannot be used
+                stale_frag_filename = encodeFilename('%s-Frag%d' % (ctx['tmpfilename'], ctx['fragment_index']))
+                if os.path.isfile(stale_frag_filename):
+                    os.remove(stale_frag_filename)
+                ctx['dest_stream'].seek(0)
+                ctx['dest_stream'].truncate()
+                ctx.update({
+                    'fragment_index': 0,
+                    'resume_len': 0,
+                    'rendition': None,
+                })
 
-        self._finish_frag_download(ctx)
+        self._start_frag_download(ctx)
+
+        if live:
+            self.to_screen('[%s] Live stream detected, recording until the playlist ends' % self.FD_NAME)
+        poll_interval = playlist['target_duration'] or 10.0
+
+        frag_index = 0
+        last_media_sequence = None
+        idle_polls = 0
+        try:
+            while True:
+                for media_sequence, frag_url in fragments:
+                    frag_index += 1
+                    last_media_sequence = media_sequence
+                    if frag_index <= ctx['fragment_index']:
+                        continue
+                    frag_filename = '%s-Frag%d' % (ctx['tmpfilename'], frag_index - 1)
+                    if switcher is not None:
+                        frag_url = switcher.fragment_url(frag_index - 1, frag_url)
+                    frag_start = time.time()
+                    try:
+                        success = ctx['dl'].download(frag_filename, {'url': frag_url})
+                    except compat_urllib_error.HTTPError as err:
+                        if live and err.code in (404, 410):
+                            # The segment has already left the live window
+                            self.report_warning('Fragment %d unavailable' % media_sequence)
+                            continue
+                        raise
+                    if not success:
+                        return False
+                    frag_elapsed = time.time() - frag_start
+                    down, frag_sanitized = sanitize_open(frag_filename, 'rb')
+                    frag_content = down.read()
+                    down.close()
+                    self._append_fragment(ctx, frag_content)
+                    os.remove(encodeFilename(frag_sanitized))
+                    if switcher is not None:
+                        switcher.report_fragment(frag_index - 1, len(frag_content), frag_elapsed)
 
-        for frag_file in frags_filenames:
-            os.remove(encodeFilename(frag_file))
+                if not live:
+                    break
+
+                time.sleep(poll_interval)
+                playlist = self._download_media_playlist(man_url)
+                if last_media_sequence is None:
+                    fragments = playlist['fragments']
+                else:
+                    fragments = [
+                        (media_sequence, frag_url)
+                        for media_sequence, frag_url in playlist['fragments']
+                        if media_sequence > last_media_sequence]
+                    if fragments and fragments[0][0] > last_media_sequence + 1:
+                        self.report_warning(
+                            'Missed %d fragments' % (fragments[0][0] - (last_media_sequence + 1)))
+                ctx['total_frags'] += len(fragments)
+                poll_interval = playlist['target_duration'] or poll_interval
+
+                if playlist['ended']:
+                    live = False
+                elif fragments:
+                    idle_polls = 0
+                else:
+                    idle_polls += 1
+                    if idle_polls >= self._LIVE_MAX_IDLE_POLLS:
+                        self.report_warning('Playlist has not been updated, stopping live recording')
+                        break
+        except KeyboardInterrupt:
+            if not live:
+                raise
+            self.to_screen('\n[%s] Interrupted by user, stopping live recording' % self.FD_NAME)
+
+        self._finish_frag_download(ctx)
 
         return True
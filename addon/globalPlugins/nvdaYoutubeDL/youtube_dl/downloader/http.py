@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
 import errno
+import io
+import json
 import os
 import socket
 import time
@@ -11,12 +13,57 @@ from ..compat import compat_urllib_error
 from ..utils import (
     ContentTooShortError,
     encodeFilename,
+    error_to_compat_str,
     sanitize_open,
     sanitized_Request,
+    write_json_file,
 )
 
 
 class HttpFD(FileDownloader):
+    _WRITE_BUFFER_SIZE = 1024 * 1024
+    # The written length of a preallocated file is recorded once this many
+    # seconds have passed or this many bytes were written since the last time
+    _RECORD_INTERVAL = 5
+    _RECORD_SIZE = 16 * 1024 * 1024
+
+    def _preallocate(self, stream, size):
+        """Reserve size bytes on disk for stream, return True on success."""
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(stream.fileno(), 0, size)
+            else:
+                stream.truncate(size)
+        except (IOError, OSError) as err:
+            self.report_warning('unable to preallocate file: %s' % error_to_compat_str(err))
+            return False
+        return True
+
+    @staticmethod
+    def _written_length_filename(tmpfilename):
+        return tmpfilename + '.ytdl'
+
+    def _read_written_length(self, tmpfilename):
+        """Return the length of the data written to a preallocated file, or None."""
+        try:
+            with io.open(encodeFilename(self._written_length_filename(tmpfilename)), 'r', encoding='utf-8') as f:
+                return int(json.load(f)['downloader']['offset'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_written_length(self, tmpfilename, length):
+        write_json_file({
+            'downloader': {
+                'offset': length,
+            },
+        }, self._written_length_filename(tmpfilename))
+
+    def _remove_written_length(self, tmpfilename):
+        try:
+            os.remove(encodeFilename(self._written_length_filename(tmpfilename)))
+        except (IOError, OSError):
+            pass
+
     def real_download(self, filename, info_dict):
         url = info_dict['url']
         tmpfilename = self.temp_name(filename)
@@ -42,6 +89,19 @@ class HttpFD(FileDownloader):
             resume_len = 0
 
         open_mode = 'wb'
+        if resume_len != 0 and self.params.get('continuedl', True):
+            # A preallocated file is longer than the data written to it if
+            # the download was killed before it could be trimmed
+            written_len = self._read_written_length(tmpfilename)
+            if written_len is not None and written_len < resume_len:
+                try:
+                    with open(encodeFilename(tmpfilename), 'r+b') as f:
+                        f.truncate(written_len)
+                    resume_len = written_len
+                except (IOError, OSError):
+                    resume_len = 0
+                self._remove_written_length(tmpfilename)
+
         if resume_len != 0:
             if self.params.get('continuedl', True):
                 self.report_resuming_byte(resume_len)
@@ -153,77 +213,149 @@ class HttpFD(FileDownloader):
         block_size = self.params.get('buffersize', 1024)
         start = time.time()
 
+        # Read into a reusable buffer when the response supports it, and
+        # gather the blocks so that the file is written in large sequential
+        # chunks instead of once per read.
+        readinto = getattr(data, 'readinto', None) if not is_test else None
+        read_buffer = bytearray(0)
+        write_buffer = bytearray()
+        preallocated = False
+        last_record = {'length': 0, 'time': 0}
+
+        def flush_write_buffer():
+            if write_buffer:
+                stream.write(write_buffer)
+                del write_buffer[:]
+                record_written_length()
+
+        def record_written_length(force=False):
+            # The size of a preallocated file says nothing about how much of
+            # it was downloaded, so a resume has to rely on this record. It
+            # may lag behind the data written, never run ahead of it.
+            if not preallocated:
+                return
+            length = stream.tell()
+            now = time.time()
+            if (not force and length - last_record['length'] < self._RECORD_SIZE and
+                    now - last_record['time'] < self._RECORD_INTERVAL):
+                return
+            stream.flush()
+            self._write_written_length(tmpfilename, length)
+            last_record.update(length=length, time=now)
+
         # measure time over whole while-loop, so slow_down() and best_block_size() work together properly
-        now = None  # needed for slow_down() in the first loop run
         before = start  # start measuring
-        while True:
-
-            # Download and write
-            data_block = data.read(block_size if not is_test else min(block_size, data_len - byte_counter))
-            byte_counter += len(data_block)
-
-            # exit loop when download is finished
-            if len(data_block) == 0:
-                break
+        try:
+            while True:
+
+                # Download and write
+                if readinto is not None:
+                    if len(read_buffer) < block_size:
+                        read_buffer = bytearray(block_size)
+                    data_block = memoryview(read_buffer)[:readinto(memoryview(read_buffer)[:block_size])]
+                else:
+                    data_block = data.read(block_size if not is_test else min(block_size, data_len - byte_counter))
+                byte_counter += len(data_block)
+
+                # exit loop when download is finished
+                if len(data_block) == 0:
+                    break
+
+                # Open destination file just in time
+                if stream is None:
+                    try:
+                        (stream, tmpfilename) = sanitize_open(tmpfilename, open_mode)
+                        assert stream is not None
+                        filename = self.undo_temp_name(tmpfilename)
+                        self.report_destination(filename)
+                    except (OSError, IOError) as err:
+                        self.report_error('unable to open for writing: %s' % str(err))
+                        return False
+
+                    if self.params.get('xattr_set_filesize', False) and data_len is not None:
+                        try:
+                            import xattr
+                            xattr.setxattr(tmpfilename, 'user.ytdl.filesize', str(data_len))
+                        except(OSError, IOError, ImportError) as err:
+                            self.report_error('unable to set filesize xattr: %s' % str(err))
+
+                    if (self.params.get('preallocate', False) and data_len is not None and
+                            open_mode == 'wb' and tmpfilename != '-'):
+                        preallocated = self._preallocate(stream, data_len)
+                        record_written_length(force=True)
 
-            # Open destination file just in time
-            if stream is None:
                 try:
-                    (stream, tmpfilename) = sanitize_open(tmpfilename, open_mode)
-                    assert stream is not None
-                    filename = self.undo_temp_name(tmpfilename)
-                    self.report_destination(filename)
-                except (OSError, IOError) as err:
-                    self.report_error('unable to open for writing: %s' % str(err))
+                    if not write_buffer and len(data_block) >= self._WRITE_BUFFER_SIZE:
+                        stream.write(data_block)
+                        record_written_length()
+                    else:
+                        write_buffer.extend(data_block)
+                        if len(write_buffer) >= self._WRITE_BUFFER_SIZE:
+                            flush_write_buffer()
+                except (IOError, OSError) as err:
+                    # How much of the block was written is unknown, so the
+                    # file is left as it is for the resume to trim
+                    preallocated = False
+                    self.to_stderr('\n')
+                    self.report_error('unable to write data: %s' % str(err))
                     return False
 
-                if self.params.get('xattr_set_filesize', False) and data_len is not None:
-                    try:
-                        import xattr
-                        xattr.setxattr(tmpfilename, 'user.ytdl.filesize', str(data_len))
-                    except(OSError, IOError, ImportError) as err:
-                        self.report_error('unable to set filesize xattr: %s' % str(err))
-
-            try:
-                stream.write(data_block)
-            except (IOError, OSError) as err:
-                self.to_stderr('\n')
-                self.report_error('unable to write data: %s' % str(err))
-                return False
-
-            # Apply rate limit
-            self.slow_down(start, now, byte_counter - resume_len)
-
-            # end measuring of one loop run
-            now = time.time()
-            after = now
-
-            # Adjust block size
-            if not self.params.get('noresizebuffer', False):
-                block_size = self.best_block_size(after - before, len(data_block))
-
-            before = after
-
-            # Progress message
-            speed = self.calc_speed(start, now, byte_counter - resume_len)
-            if data_len is None:
-                eta = None
-            else:
-                eta = self.calc_eta(start, time.time(), data_len - resume_len, byte_counter - resume_len)
-
-            self._hook_progress({
-                'status': 'downloading',
-                'downloaded_bytes': byte_counter,
-                'total_bytes': data_len,
-                'tmpfilename': tmpfilename,
-                'filename': filename,
-                'eta': eta,
-                'speed': speed,
-                'elapsed': now - start,
-            })
-
-            if is_test and byte_counter == data_len:
-                break
+                # Apply rate limit
+                self.slow_down(len(data_block))
+
+                # end measuring of one loop run
+                now = time.time()
+                after = now
+
+                # Adjust block size
+                if not self.params.get('noresizebuffer', False):
+                    block_size = self.best_block_size(after - before, len(data_block))
+
+                before = after
+
+                # Progress message
+                speed = self.calc_speed(start, now, byte_counter - resume_len)
+                if data_len is None:
+                    eta = None
+                else:
+                    eta = self.calc_eta(start, time.time(), data_len - resume_len, byte_counter - resume_len)
+
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': byte_counter,
+                    'total_bytes': data_len,
+                    'tmpfilename': tmpfilename,
+                    'filename': filename,
+                    'eta': eta,
+                    'speed': speed,
+                    'elapsed': now - start,
+                })
+
+                if is_test and byte_counter == data_len:
+                    break
+
+            if stream is not None:
+                try:
+                    flush_write_buffer()
+                except (IOError, OSError) as err:
+                    preallocated = False
+                    self.to_stderr('\n')
+                    self.report_error('unable to write data: %s' % str(err))
+                    return False
+        finally:
+            if preallocated:
+                # Keep the .part file size equal to the data written to it,
+                # otherwise a later resume would take the preallocated tail
+                # for downloaded data. If writing fails, the record of the
+                # written length stays for the resume to rely on.
+                try:
+                    flush_write_buffer()
+                    stream.flush()
+                    stream.truncate(stream.tell())
+                except (IOError, OSError):
+                    pass
+                else:
+                    self._remove_written_length(tmpfilename)
 
         if stream is None:
             self.to_stderr('\n')
@@ -9,6 +9,7 @@ import os
 import re
 import socket
 import sys
+import threading
 import time
 
 from ..compat import (
@@ -35,6 +36,8 @@ from ..utils import (
     fix_xml_ampersands,
     float_or_none,
     int_or_none,
+    orderedSet,
+    parallel_map,
     RegexNotFoundError,
     sanitize_filename,
     sanitized_Request,
@@ -248,6 +251,9 @@ class InfoExtractor(object):
     _ready = False
     _downloader = None
     _WORKING = True
+    # Extractors are shared by concurrent extractions; this makes sure each
+    # one is only initialized once
+    _initialize_lock = threading.RLock()
 
     def __init__(self, downloader=None):
         """Constructor. Receives an optional downloader."""
@@ -280,9 +286,12 @@ class InfoExtractor(object):
 
     def initialize(self):
         """Initializes an instance (authentication, etc)."""
-        if not self._ready:
-            self._real_initialize()
-            self._ready = True
+        if self._ready:
+            return
+        with self._initialize_lock:
+            if not self._ready:
+                self._real_initialize()
+                self._ready = True
 
     def extract(self, url):
         """Extracts URL information and returns it in list of dicts."""
@@ -763,48 +772,55 @@ class InfoExtractor(object):
             html, '%s form' % form_id, group='form')
         return self._hidden_inputs(form)
 
+    # Extension preferences used by _sort_formats, indexed by
+    # (is audio only, prefer free formats)
+    _EXT_PREFERENCES = dict(
+        ((audio_only, prefer_free), dict((ext, idx) for idx, ext in enumerate(order)))
+        for (audio_only, prefer_free), order in {
+            (True, True): ['aac', 'mp3', 'm4a', 'webm', 'ogg', 'opus'],
+            (True, False): ['webm', 'opus', 'ogg', 'mp3', 'aac', 'm4a'],
+            (False, True): ['flv', 'mp4', 'webm'],
+            (False, False): ['webm', 'flv', 'mp4'],
+        }.items())
+
     def _sort_formats(self, formats, field_preference=None):
         if not formats:
             raise ExtractorError('No video formats found')
 
-        def _formats_key(f):
+        for f in formats:
             # TODO remove the following workaround
-            from ..utils import determine_ext
             if not f.get('ext') and 'url' in f:
                 f['ext'] = determine_ext(f['url'])
 
-            if isinstance(field_preference, (list, tuple)):
-                return tuple(f.get(field) if f.get(field) is not None else -1 for field in field_preference)
+        if isinstance(field_preference, (list, tuple)):
+            formats.sort(key=lambda f: tuple(
+                f.get(field) if f.get(field) is not None else -1
+                for field in field_preference))
+            return
 
+        prefer_free_formats = bool(self._downloader.params.get('prefer_free_formats'))
+
+        def _formats_key(f):
             preference = f.get('preference')
             if preference is None:
                 proto = f.get('protocol')
                 if proto is None:
-                    proto = compat_urllib_parse_urlparse(f.get('url', '')).scheme
+                    url = f.get('url', '')
+                    if url.startswith(('http://', 'https://')):
+                        proto = 'http'
+                    else:
+                        proto = compat_urllib_parse_urlparse(url).scheme
 
                 preference = 0 if proto in ['http', 'https'] else -0.1
                 if f.get('ext') in ['f4f', 'f4m']:  # Not yet supported
                     preference -= 0.5
 
-            if f.get('vcodec') == 'none':  # audio only
-                if self._downloader.params.get('prefer_free_formats'):
-                    ORDER = ['aac', 'mp3', 'm4a', 'webm', 'ogg', 'opus']
-                else:
-                    ORDER = ['webm', 'opus', 'ogg', 'mp3', 'aac', 'm4a']
+            audio_only = f.get('vcodec') == 'none'
+            ext_preference = self._EXT_PREFERENCES[(audio_only, prefer_free_formats)].get(f.get('ext'), -1)
+            if audio_only:
+                audio_ext_preference = ext_preference
                 ext_preference = 0
-                try:
-                    audio_ext_preference = ORDER.index(f['ext'])
-                except ValueError:
-                    audio_ext_preference = -1
             else:
-                if self._downloader.params.get('prefer_free_formats'):
-                    ORDER = ['flv', 'mp4', 'webm']
-                else:
-                    ORDER = ['webm', 'flv', 'mp4']
-                try:
-                    ext_preference = ORDER.index(f['ext'])
-                except ValueError:
-                    ext_preference = -1
                 audio_ext_preference = 0
 
             return (
@@ -1395,6 +1411,40 @@ class SearchInfoExtractor(InfoExtractor):
         """Get a specified number of results for a query"""
         raise NotImplementedError("This method must be implemented by subclasses")
 
+    # Number of result pages requested at once by _search_pages
+    _SEARCH_PAGE_WORKERS = 4
+
+    def _search_pages(self, n, page_size, get_page, first_page=0):
+        """
+        Collect the first n distinct results of a paged search.
+
+        get_page(pagenum) must return a tuple of the list of results on that
+        page and whether further pages may follow. The pages expected to hold
+        the missing results are requested concurrently; more are requested
+        while duplicates or short pages leave fewer than n results.
+        """
+        items = []
+        pagenum = first_page
+        has_more = True
+        while has_more:
+            missing = n - len(set(items))
+            if missing <= 0:
+                break
+            if missing == float('inf'):
+                page_count = self._SEARCH_PAGE_WORKERS
+            else:
+                page_count = (int(missing) + page_size - 1) // page_size
+            pages = parallel_map(
+                get_page, range(pagenum, pagenum + page_count),
+                self._SEARCH_PAGE_WORKERS)
+            for page_items, has_more in pages:
+                items.extend(page_items)
+                pagenum += 1
+                if not has_more:
+                    break
+        results = orderedSet(items)
+        return results if n == float('inf') else results[:n]
+
     @property
     def SEARCH_KEY(self):
         return self._SEARCH_KEY
@@ -1,6 +1,5 @@
 from __future__ import unicode_literals
 
-import itertools
 import re
 
 from .common import SearchInfoExtractor
@@ -26,14 +25,7 @@ class GoogleSearchIE(SearchInfoExtractor):
     def _get_n_results(self, query, n):
         """Get a specified number of results for a query"""
 
-        entries = []
-        res = {
-            '_type': 'playlist',
-            'id': query,
-            'title': query,
-        }
-
-        for pagenum in itertools.count():
+        def get_page(pagenum):
             result_url = (
                 'http://www.google.com/search?tbm=vid&q=%s&start=%s&hl=en'
                 % (compat_urllib_parse.quote_plus(query), pagenum * 10))
@@ -42,6 +34,7 @@ class GoogleSearchIE(SearchInfoExtractor):
                 result_url, 'gvsearch:' + query,
                 note='Downloading result page ' + str(pagenum + 1))
 
+            urls = []
             for hit_idx, mobj in enumerate(re.finditer(
                     r'<h3 class="r"><a href="([^"]+)"', webpage)):
 
@@ -49,11 +42,16 @@ class GoogleSearchIE(SearchInfoExtractor):
                 if not re.search(r'id="vidthumb%d"' % (hit_idx + 1), webpage):
                     continue
 
-                entries.append({
-                    '_type': 'url',
-                    'url': mobj.group(1)
-                })
+                urls.append(mobj.group(1))
 
-            if (len(entries) >= n) or not re.search(r'id="pnnext"', webpage):
-                res['entries'] = entries[:n]
-                return res
+            return urls, re.search(r'id="pnnext"', webpage) is not None
+
+        return {
+            '_type': 'playlist',
+            'id': query,
+            'title': query,
+            'entries': [{
+                '_type': 'url',
+                'url': url,
+            } for url in self._search_pages(n, 10, get_page)],
+        }
@@ -489,44 +489,29 @@ class SoundcloudSearchIE(SearchInfoExtractor, SoundcloudIE):
 
     _SEARCH_KEY = 'scsearch'
     _MAX_RESULTS_PER_PAGE = 200
-    _DEFAULT_RESULTS_PER_PAGE = 50
     _API_V2_BASE = 'https://api-v2.soundcloud.com'
 
-    def _get_collection(self, endpoint, collection_id, **query):
-        limit = min(
-            query.get('limit', self._DEFAULT_RESULTS_PER_PAGE),
-            self._MAX_RESULTS_PER_PAGE)
-        query['limit'] = limit
-        query['client_id'] = self._CLIENT_ID
-        query['linked_partitioning'] = '1'
-        query['offset'] = 0
-        data = compat_urllib_parse.urlencode(encode_dict(query))
-        next_url = '{0}{1}?{2}'.format(self._API_V2_BASE, endpoint, data)
-
-        collected_results = 0
-
-        for i in itertools.count(1):
+    def _get_n_results(self, query, n):
+        limit = int(min(n, self._MAX_RESULTS_PER_PAGE))
+
+        def get_page(pagenum):
+            data = compat_urllib_parse.urlencode(encode_dict({
+                'q': query,
+                'limit': limit,
+                'offset': pagenum * limit,
+                'client_id': self._CLIENT_ID,
+                'linked_partitioning': '1',
+            }))
             response = self._download_json(
-                next_url, collection_id, 'Downloading page {0}'.format(i),
+                '{0}/search/tracks?{1}'.format(self._API_V2_BASE, data), query,
+                'Downloading page {0}'.format(pagenum + 1),
                 'Unable to download API page')
-
-            collection = response.get('collection', [])
-            if not collection:
-                break
-
-            collection = list(filter(bool, collection))
-            collected_results += len(collection)
-
-            for item in collection:
-                yield self.url_result(item['uri'], SoundcloudIE.ie_key())
-
-            if not collection or collected_results >= limit:
-                break
-
-            next_url = response.get('next_href')
-            if not next_url:
-                break
-
-    def _get_n_results(self, query, n):
-        tracks = self._get_collection('/search/tracks', query, limit=n, q=query)
+            collection = list(filter(bool, response.get('collection') or []))
+            return (
+                [item['uri'] for item in collection],
+                bool(collection and response.get('next_href')))
+
+        tracks = [
+            self.url_result(uri, SoundcloudIE.ie_key())
+            for uri in self._search_pages(n, limit, get_page)]
         return self.playlist_result(tracks, playlist_title=query)
@@ -1,7 +1,6 @@
 # coding: utf-8
 from __future__ import unicode_literals
 
-import itertools
 import json
 import re
 
@@ -303,22 +302,20 @@ class YahooSearchIE(SearchInfoExtractor):
 
     def _get_n_results(self, query, n):
         """Get a specified number of results for a query"""
-        entries = []
-        for pagenum in itertools.count(0):
+        def get_page(pagenum):
             result_url = 'http://video.search.yahoo.com/search/?p=%s&fr=screen&o=js&gs=0&b=%d' % (compat_urllib_parse.quote_plus(query), pagenum * 30)
             info = self._download_json(result_url, query,
                                        note='Downloading results page ' + str(pagenum + 1))
             m = info['m']
-            results = info['results']
-
-            for (i, r) in enumerate(results):
-                if (pagenum * 30) + i >= n:
-                    break
+            urls = []
+            for r in info['results']:
                 mobj = re.search(r'(?P<url>screen\.yahoo\.com/.*?-\d*?\.html)"', r)
-                e = self.url_result('http://' + mobj.group('url'), 'Yahoo')
-                entries.append(e)
-            if (pagenum * 30 + i >= n) or (m['last'] >= (m['total'] - 1)):
-                break
+                urls.append('http://' + mobj.group('url'))
+            return urls, m['last'] < (m['total'] - 1)
+
+        entries = [
+            self.url_result(url, 'Yahoo')
+            for url in self._search_pages(n, 30, get_page)]
 
         return {
             '_type': 'playlist',
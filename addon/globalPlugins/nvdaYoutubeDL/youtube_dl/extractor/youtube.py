@@ -24,6 +24,7 @@ from ..compat import (
     compat_str,
 )
 from ..utils import (
+    BackgroundCall,
     clean_html,
     encode_dict,
     error_to_compat_str,
@@ -185,17 +186,23 @@ class YoutubeEntryListBaseInfoExtractor(InfoExtractor):
     def _entries(self, page, playlist_id):
         more_widget_html = content_html = page
         for page_num in itertools.count(1):
+            mobj = re.search(r'data-uix-load-more-href="/?(?P<more>[^"]+)"', more_widget_html)
+            more_call = None
+            if mobj:
+                # The next page is downloaded while the entries of this one are consumed
+                more_call = BackgroundCall(
+                    self._download_json,
+                    'https://youtube.com/%s' % mobj.group('more'), playlist_id,
+                    'Downloading page #%s' % page_num,
+                    transform_source=uppercase_escape)
+
             for entry in self._process_page(content_html):
                 yield entry
 
-            mobj = re.search(r'data-uix-load-more-href="/?(?P<more>[^"]+)"', more_widget_html)
-            if not mobj:
+            if more_call is None:
                 break
 
-            more = self._download_json(
-                'https://youtube.com/%s' % mobj.group('more'), playlist_id,
-                'Downloading page #%s' % page_num,
-                transform_source=uppercase_escape)
+            more = more_call.result()
             content_html = more['content_html']
             if not content_html.strip():
                 # Some webpages show a "Load more" button but they don't
@@ -212,6 +219,8 @@ class YoutubePlaylistBaseInfoExtractor(YoutubeEntryListBaseInfoExtractor):
     def extract_videos_from_page(self, page):
         ids_in_page = []
         titles_in_page = []
+        # Index of every video id in ids_in_page
+        id_indices = {}
         for mobj in re.finditer(self._VIDEO_RE, page):
             # The link with index 0 is not the first video of the playlist (not sure if still actual)
             if 'index' in mobj.groupdict() and mobj.group('id') == '0':
@@ -220,13 +229,13 @@ class YoutubePlaylistBaseInfoExtractor(YoutubeEntryListBaseInfoExtractor):
             video_title = unescapeHTML(mobj.group('title'))
             if video_title:
                 video_title = video_title.strip()
-            try:
-                idx = ids_in_page.index(video_id)
-                if video_title and not titles_in_page[idx]:
-                    titles_in_page[idx] = video_title
-            except ValueError:
+            idx = id_indices.get(video_id)
+            if idx is None:
+                id_indices[video_id] = len(ids_in_page)
                 ids_in_page.append(video_id)
                 titles_in_page.append(video_title)
+            elif video_title and not titles_in_page[idx]:
+                titles_in_page[idx] = video_title
         return zip(ids_in_page, titles_in_page)
 
 
@@ -752,6 +761,8 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
     def __init__(self, *args, **kwargs):
         super(YoutubeIE, self).__init__(*args, **kwargs)
         self._player_cache = {}
+        # Parsed Flash players by player id
+        self._swf_interpreters = {}
 
     def report_video_info_webpage_download(self, video_id):
         """Report attempt to download video info webpage."""
@@ -803,12 +814,14 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                 errnote='Download of %s failed' % player_url)
             res = self._parse_sig_js(code)
         elif player_type == 'swf':
-            urlh = self._request_webpage(
-                player_url, video_id,
-                note=download_note,
-                errnote='Download of %s failed' % player_url)
-            code = urlh.read()
-            res = self._parse_sig_swf(code)
+            swfi = self._swf_interpreters.get(player_id)
+            if swfi is None:
+                urlh = self._request_webpage(
+                    player_url, video_id,
+                    note=download_note,
+                    errnote='Download of %s failed' % player_url)
+                swfi = self._swf_interpreters[player_id] = SWFInterpreter(urlh.read())
+            res = self._parse_sig_swf(swfi)
         else:
             assert False, 'Invalid player type %r' % player_type
 
@@ -867,8 +880,7 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         initial_function = jsi.extract_function(funcname)
         return lambda s: initial_function([s])
 
-    def _parse_sig_swf(self, file_contents):
-        swfi = SWFInterpreter(file_contents)
+    def _parse_sig_swf(self, swfi):
         TARGET_CLASSNAME = 'SignatureDecipher'
         searched_class = swfi.extract_class(TARGET_CLASSNAME)
         initial_function = swfi.extract_function(searched_class, 'decipher')
@@ -1027,19 +1039,25 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         url = 'https://www.youtube.com/annotations_invideo?features=1&legacy=1&video_id=%s' % video_id
         return self._download_webpage(url, video_id, note='Searching for annotations.', errnote='Unable to download video annotations.')
 
-    def _parse_dash_manifest(
+    def _download_dash_manifest(
             self, video_id, dash_manifest_url, player_url, age_gate, fatal=True):
         def decrypt_sig(mobj):
             s = mobj.group(1)
             dec_s = self._decrypt_signature(s, video_id, player_url, age_gate)
             return '/signature/%s' % dec_s
         dash_manifest_url = re.sub(r'/s/([a-fA-F0-9\.]+)', decrypt_sig, dash_manifest_url)
-        dash_doc = self._download_xml(
+        return self._download_xml(
             dash_manifest_url, video_id,
             note='Downloading DASH manifest',
             errnote='Could not download DASH manifest',
             fatal=fatal)
 
+    def _parse_dash_manifest(
+            self, video_id, dash_manifest_url, player_url, age_gate, fatal=True, dash_doc=None):
+        if dash_doc is None:
+            dash_doc = self._download_dash_manifest(
+                video_id, dash_manifest_url, player_url, age_gate, fatal)
+
         if dash_doc is False:
             return []
 
@@ -1180,14 +1198,28 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                 # The general idea is to take a union of itags of both DASH manifests (for example
                 # video with such 'manifest behavior' see https://github.com/rg3/youtube-dl/issues/6093)
                 self.report_video_info_webpage_download(video_id)
-                for el_type in ['&el=info', '&el=embedded', '&el=detailpage', '&el=vevo', '']:
-                    video_info_url = (
-                        '%s://www.youtube.com/get_video_info?&video_id=%s%s&ps=default&eurl=&gl=US&hl=en'
-                        % (proto, video_id, el_type))
-                    video_info_webpage = self._download_webpage(
-                        video_info_url,
-                        video_id, note=False,
+                video_info_urls = [
+                    '%s://www.youtube.com/get_video_info?&video_id=%s%s&ps=default&eurl=&gl=US&hl=en'
+                    % (proto, video_id, el_type)
+                    for el_type in ['&el=info', '&el=embedded', '&el=detailpage', '&el=vevo', '']]
+
+                def download_video_info(video_info_url):
+                    return self._download_webpage(
+                        video_info_url, video_id, note=False,
                         errnote='unable to download video info webpage')
+
+                def video_info_webpages():
+                    # The first variant usually contains a token. The other ones
+                    # are only needed when it does not, and are then requested
+                    # all at once; their responses are still examined in order.
+                    yield download_video_info(video_info_urls[0])
+                    video_info_calls = [
+                        BackgroundCall(download_video_info, video_info_url)
+                        for video_info_url in video_info_urls[1:]]
+                    for video_info_call in video_info_calls:
+                        yield video_info_call.result()
+
+                for video_info_webpage in video_info_webpages():
                     get_video_info = compat_parse_qs(video_info_webpage)
                     if get_video_info.get('use_cipher_signature') != ['True']:
                         add_dash_mpd(get_video_info)
@@ -1510,11 +1542,20 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         # Look for the DASH manifest
         if self._downloader.params.get('youtube_include_dash_manifest', True):
             dash_mpd_fatal = True
-            for dash_manifest_url in dash_mpds:
+            # Download all DASH manifests in parallel, they are merged in order
+            # below. Only the first one may fail with a bug report message, see
+            # the workaround for HTTP Error 403 below.
+            dash_doc_calls = [
+                BackgroundCall(
+                    self._download_dash_manifest,
+                    video_id, dash_manifest_url, player_url, age_gate, fatal=i == 0)
+                for i, dash_manifest_url in enumerate(dash_mpds)]
+            for dash_manifest_url, dash_doc_call in zip(dash_mpds, dash_doc_calls):
                 dash_formats = {}
                 try:
                     for df in self._parse_dash_manifest(
-                            video_id, dash_manifest_url, player_url, age_gate, dash_mpd_fatal):
+                            video_id, dash_manifest_url, player_url, age_gate, dash_mpd_fatal,
+                            dash_doc=dash_doc_call.result()):
                         # Do not overwrite DASH format found in some previous DASH manifest
                         if df['format_id'] not in dash_formats:
                             dash_formats[df['format_id']] = df
@@ -1890,15 +1931,13 @@ class YoutubeSearchIE(SearchInfoExtractor, YoutubePlaylistIE):
     IE_NAME = 'youtube:search'
     _SEARCH_KEY = 'ytsearch'
     _EXTRA_QUERY_ARGS = {}
+    _RESULTS_PER_PAGE = 20
     _TESTS = []
 
     def _get_n_results(self, query, n):
         """Get a specified number of results for a query"""
 
-        videos = []
-        limit = n
-
-        for pagenum in itertools.count(1):
+        def get_page(pagenum):
             url_query = {
                 'search_query': query.encode('utf-8'),
                 'page': pagenum,
@@ -1916,15 +1955,12 @@ class YoutubeSearchIE(SearchInfoExtractor, YoutubePlaylistIE):
                 raise ExtractorError(
                     '[youtube] No video results', expected=True)
 
-            new_videos = self._ids_to_results(orderedSet(re.findall(
-                r'href="/watch\?v=(.{11})', html_content)))
-            videos += new_videos
-            if not new_videos or len(videos) > limit:
-                break
+            new_ids = orderedSet(re.findall(
+                r'href="/watch\?v=(.{11})', html_content))
+            return new_ids, bool(new_ids)
 
-        if len(videos) > n:
-            videos = videos[:n]
-        return self.playlist_result(videos, query)
+        video_ids = self._search_pages(n, self._RESULTS_PER_PAGE, get_page, first_page=1)
+        return self.playlist_result(self._ids_to_results(video_ids), query)
 
 
 class YoutubeSearchDateIE(YoutubeSearchIE):
@@ -154,6 +154,11 @@ def parseOpts(overrideArguments=None):
         '--force-generic-extractor',
         action='store_true', dest='force_generic_extractor', default=False,
         help='Force extraction to use the generic extractor')
+    general.add_option(
+        '--concurrent-extractions',
+        dest='concurrent_extractions', metavar='N', type=int,
+        help='When downloading several URLs, extract up to N of them at once while the current one is '
+             'downloaded (default is 1)')
     general.add_option(
         '--default-search',
         dest='default_search', metavar='PREFIX',
@@ -386,7 +391,12 @@ def parseOpts(overrideArguments=None):
     downloader.add_option(
         '-r', '--rate-limit',
         dest='ratelimit', metavar='LIMIT',
-        help='Maximum download rate in bytes per second (e.g. 50K or 4.2M)')
+        help='Maximum download rate in bytes per second (e.g. 50K or 4.2M), shared by all downloads')
+    downloader.add_option(
+        '--rate-limit-burst',
+        dest='ratelimit_burst', metavar='SIZE',
+        help='Amount of data that may be downloaded at full speed before the rate limit applies (e.g. 1M) '
+             '(default is one second worth of the rate limit)')
     downloader.add_option(
         '-R', '--retries',
         dest='retries', metavar='RETRIES', default=10,
@@ -411,10 +421,23 @@ def parseOpts(overrideArguments=None):
         '--xattr-set-filesize',
         dest='xattr_set_filesize', action='store_true',
         help='Set file xattribute ytdl.filesize with expected filesize (experimental)')
+    downloader.add_option(
+        '--preallocate',
+        dest='preallocate', action='store_true', default=False,
+        help='Reserve disk space for the whole file before downloading when its size is known')
     downloader.add_option(
         '--hls-prefer-native',
         dest='hls_prefer_native', action='store_true',
         help='Use the native HLS downloader instead of ffmpeg (experimental)')
+    downloader.add_option(
+        '--hls-adaptive-max-eta',
+        dest='hls_adaptive_max_eta', metavar='SECONDS', type=float,
+        help='With the native HLS downloader, switch to a lower or higher bitrate variant of the video '
+             'to keep the estimated download time under SECONDS (experimental)')
+    downloader.add_option(
+        '--concurrent-fragments',
+        dest='concurrent_fragment_downloads', metavar='N', type=int,
+        help='Number of DASH fragments to download at once (default is 1)')
     downloader.add_option(
         '--external-downloader',
         dest='external_downloader', metavar='COMMAND',
@@ -657,6 +680,11 @@ def parseOpts(overrideArguments=None):
     filesystem.add_option(
         '--no-cache-dir', action='store_const', const=False, dest='cachedir',
         help='Disable filesystem caching')
+    filesystem.add_option(
+        '--extraction-cache-ttl',
+        dest='extraction_cache_ttl', metavar='SECONDS', type=int,
+        help='Reuse the information extracted for a video URL for up to SECONDS seconds, '
+             'or until its media URLs expire')
     filesystem.add_option(
         '--rm-cache-dir',
         action='store_true', dest='rm_cachedir',
@@ -20,7 +20,7 @@ from ..utils import (
     prepend_extension,
     shell_quote,
     subtitles_filename,
-    dfxp2srt,
+    dfxp2srt_iter,
     ISO639Utils,
 )
 
@@ -496,16 +496,29 @@ class FFmpegSubtitlesConvertorPP(FFmpegPostProcessor):
                 dfxp_file = subtitles_filename(filename, lang, ext)
                 srt_file = subtitles_filename(filename, lang, 'srt')
 
-                with io.open(dfxp_file, 'rt', encoding='utf-8') as f:
-                    srt_data = dfxp2srt(f.read())
-
-                with io.open(srt_file, 'wt', encoding='utf-8') as f:
-                    f.write(srt_data)
-
+                # The cues are streamed to a temporary file, so that a
+                # malformed dfxp file does not leave a partial .srt behind
+                temp_srt_file = prepend_extension(srt_file, 'temp')
+                try:
+                    with io.open(encodeFilename(dfxp_file), 'rb') as f, \
+                            io.open(encodeFilename(temp_srt_file), 'wt', encoding='utf-8') as srt_f:
+                        for srt_cue in dfxp2srt_iter(f):
+                            srt_f.write(srt_cue)
+                except Exception:
+                    if os.path.exists(encodeFilename(temp_srt_file)):
+                        os.remove(encodeFilename(temp_srt_file))
+                    raise
+                if os.path.exists(encodeFilename(srt_file)):
+                    os.remove(encodeFilename(srt_file))
+                os.rename(encodeFilename(temp_srt_file), encodeFilename(srt_file))
+
+                # The converted subtitles are only kept on disk, reading them
+                # back would hold the whole file in memory. 'data' is kept as
+                # None, the subtitles are in the file next to the video
                 ext = 'srt'
                 subs[lang] = {
                     'ext': 'srt',
-                    'data': srt_data
+                    'data': None,
                 }
 
                 if new_ext == 'srt':
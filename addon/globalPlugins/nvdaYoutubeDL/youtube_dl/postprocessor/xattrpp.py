@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+import base64
 import os
 import subprocess
 import sys
@@ -16,6 +17,10 @@ from ..utils import (
 )
 
 
+# Function writing xattrs, see _find_xattr_writer; False if none was found
+_xattr_writer = None
+
+
 class XAttrMetadataError(PostProcessingError):
     def __init__(self, code=None, msg='Unknown error'):
         super(XAttrMetadataError, self).__init__(msg)
@@ -31,6 +36,127 @@ class XAttrMetadataError(PostProcessingError):
             self.reason = 'NOT_SUPPORTED'
 
 
+def _xattr_error(e):
+    return XAttrMetadataError(e.errno, e.strerror)
+
+
+def _find_xattr_writer():
+    """
+    Find the best way to set extended attributes on this system.
+
+    Returns a tuple of a function writing a list of (name, value) pairs to
+    the xattrs of a file, or None if no backend was found, and a warning
+    to report, if any.
+    """
+    warning = None
+
+    if hasattr(os, 'setxattr'):
+        def write_xattrs(path, attrs):
+            try:
+                for key, value in attrs:
+                    os.setxattr(path, key, value)
+            except EnvironmentError as e:
+                raise _xattr_error(e)
+
+        return write_xattrs, warning
+
+    try:
+        # try the pyxattr module...
+        import xattr
+
+        # Unicode arguments are not supported in python-pyxattr until
+        # version 0.5.0
+        # See https://github.com/rg3/youtube-dl/issues/5498
+        pyxattr_required_version = '0.5.0'
+        if version_tuple(xattr.__version__) < version_tuple(pyxattr_required_version):
+            warning = (
+                'python-pyxattr is detected but is too old. '
+                'youtube-dl requires %s or above while your version is %s. '
+                'Falling back to other xattr implementations' % (
+                    pyxattr_required_version, xattr.__version__))
+            raise ImportError
+
+        def write_xattrs(path, attrs):
+            try:
+                for key, value in attrs:
+                    xattr.set(path, key, value)
+            except EnvironmentError as e:
+                raise _xattr_error(e)
+
+        return write_xattrs, warning
+    except ImportError:
+        pass
+
+    if os.name == 'nt':
+        # Write xattrs to NTFS Alternate Data Streams:
+        # http://en.wikipedia.org/wiki/NTFS#Alternate_data_streams_.28ADS.29
+        def write_xattrs(path, attrs):
+            assert os.path.exists(path)
+            for key, value in attrs:
+                assert ':' not in key
+
+                ads_fn = path + ":" + key
+                try:
+                    with open(ads_fn, "wb") as f:
+                        f.write(value)
+                except EnvironmentError as e:
+                    raise _xattr_error(e)
+
+        return write_xattrs, warning
+
+    def run_tool(cmd, stdin_data=None):
+        try:
+            p = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
+        except EnvironmentError as e:
+            raise _xattr_error(e)
+        stdout, stderr = p.communicate(stdin_data)
+        stderr = stderr.decode('utf-8', 'replace')
+        if p.returncode != 0:
+            raise XAttrMetadataError(p.returncode, stderr)
+
+    if check_executable('setfattr', ['--version']):
+        def write_xattrs(path, attrs):
+            # All attributes are restored at once from a dump in the format
+            # of "getfattr --dump", with base64 encoded values
+            path = encodeFilename(path, True)
+            if not isinstance(path, bytes):
+                path = path.encode(sys.getfilesystemencoding())
+            lines = [b'# file: ' + _quote_setfattr_path(path)]
+            lines.extend(
+                key.encode('ascii') + b'=0s' + base64.b64encode(value)
+                for key, value in attrs)
+            run_tool(
+                [encodeFilename('setfattr', True), encodeArgument('--restore=-')],
+                b'\n'.join(lines) + b'\n\n')
+
+        return write_xattrs, warning
+
+    if check_executable('xattr', ['-h']):
+        def write_xattrs(path, attrs):
+            # The xattr tool can only write one attribute at a time
+            for key, value in attrs:
+                cmd = ([encodeFilename('xattr', True)] +
+                       [encodeArgument(o) for o in ['-w', key, value.decode('utf-8')]] +
+                       [encodeFilename(path, True)])
+                run_tool(cmd)
+
+        return write_xattrs, warning
+
+    return None, warning
+
+
+def _quote_setfattr_path(path):
+    # Escape bytes the way getfattr does in its dump output
+    res = bytearray()
+    for c in bytearray(path):
+        if 0x21 <= c <= 0x7e and c not in (0x3d, 0x5c):  # not "=" or "\\"
+            res.append(c)
+        else:
+            res.extend(('\\%03o' % c).encode('ascii'))
+    return bytes(res)
+
+
 class XAttrMetadataPP(PostProcessor):
 
     #
@@ -46,88 +172,30 @@ class XAttrMetadataPP(PostProcessor):
 
     def run(self, info):
         """ Set extended attributes on downloaded file (if xattr support is found). """
-
-        # This mess below finds the best xattr tool for the job and creates a
-        # "write_xattr" function.
-        try:
-            # try the pyxattr module...
-            import xattr
-
-            # Unicode arguments are not supported in python-pyxattr until
-            # version 0.5.0
-            # See https://github.com/rg3/youtube-dl/issues/5498
-            pyxattr_required_version = '0.5.0'
-            if version_tuple(xattr.__version__) < version_tuple(pyxattr_required_version):
-                self._downloader.report_warning(
-                    'python-pyxattr is detected but is too old. '
-                    'youtube-dl requires %s or above while your version is %s. '
-                    'Falling back to other xattr implementations' % (
-                        pyxattr_required_version, xattr.__version__))
-
-                raise ImportError
-
-            def write_xattr(path, key, value):
-                try:
-                    xattr.set(path, key, value)
-                except EnvironmentError as e:
-                    raise XAttrMetadataError(e.errno, e.strerror)
-
-        except ImportError:
-            if os.name == 'nt':
-                # Write xattrs to NTFS Alternate Data Streams:
-                # http://en.wikipedia.org/wiki/NTFS#Alternate_data_streams_.28ADS.29
-                def write_xattr(path, key, value):
-                    assert ':' not in key
-                    assert os.path.exists(path)
-
-                    ads_fn = path + ":" + key
-                    try:
-                        with open(ads_fn, "wb") as f:
-                            f.write(value)
-                    except EnvironmentError as e:
-                        raise XAttrMetadataError(e.errno, e.strerror)
+        global _xattr_writer
+
+        # The best xattr tool for the job is only looked up once per process
+        if _xattr_writer is None:
+            write_xattrs, warning = _find_xattr_writer()
+            if warning:
+                self._downloader.report_warning(warning)
+            _xattr_writer = write_xattrs or False
+        write_xattrs = _xattr_writer
+
+        if not write_xattrs:
+            # On Unix, and can't find pyxattr, setfattr, or xattr.
+            if sys.platform.startswith('linux'):
+                self._downloader.report_error(
+                    "Couldn't find a tool to set the xattrs. "
+                    "Install either the python 'pyxattr' or 'xattr' "
+                    "modules, or the GNU 'attr' package "
+                    "(which contains the 'setfattr' tool).")
             else:
-                user_has_setfattr = check_executable("setfattr", ['--version'])
-                user_has_xattr = check_executable("xattr", ['-h'])
-
-                if user_has_setfattr or user_has_xattr:
-
-                    def write_xattr(path, key, value):
-                        value = value.decode('utf-8')
-                        if user_has_setfattr:
-                            executable = 'setfattr'
-                            opts = ['-n', key, '-v', value]
-                        elif user_has_xattr:
-                            executable = 'xattr'
-                            opts = ['-w', key, value]
-
-                        cmd = ([encodeFilename(executable, True)] +
-                               [encodeArgument(o) for o in opts] +
-                               [encodeFilename(path, True)])
-
-                        try:
-                            p = subprocess.Popen(
-                                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                        except EnvironmentError as e:
-                            raise XAttrMetadataError(e.errno, e.strerror)
-                        stdout, stderr = p.communicate()
-                        stderr = stderr.decode('utf-8', 'replace')
-                        if p.returncode != 0:
-                            raise XAttrMetadataError(p.returncode, stderr)
-
-                else:
-                    # On Unix, and can't find pyxattr, setfattr, or xattr.
-                    if sys.platform.startswith('linux'):
-                        self._downloader.report_error(
-                            "Couldn't find a tool to set the xattrs. "
-                            "Install either the python 'pyxattr' or 'xattr' "
-                            "modules, or the GNU 'attr' package "
-                            "(which contains the 'setfattr' tool).")
-                    else:
-                        self._downloader.report_error(
-                            "Couldn't find a tool to set the xattrs. "
-                            "Install either the python 'xattr' module, "
-                            "or the 'xattr' binary.")
+                self._downloader.report_error(
+                    "Couldn't find a tool to set the xattrs. "
+                    "Install either the python 'xattr' module, "
+                    "or the 'xattr' binary.")
+            return [], info
 
         # Write the metadata to the file's xattrs
         self._downloader.to_screen('[metadata] Writing metadata to file\'s xattrs')
@@ -145,6 +213,7 @@ class XAttrMetadataPP(PostProcessor):
                 'user.dublincore.format': 'format',
             }
 
+            attrs = []
             for xattrname, infoname in xattr_mapping.items():
 
                 value = info.get(infoname)
@@ -153,8 +222,10 @@ class XAttrMetadataPP(PostProcessor):
                     if infoname == "upload_date":
                         value = hyphenate_date(value)
 
-                    byte_value = value.encode('utf-8')
-                    write_xattr(filename, xattrname, byte_value)
+                    attrs.append((xattrname, value.encode('utf-8')))
+
+            if attrs:
+                write_xattrs(filename, attrs)
 
             return [], info
 
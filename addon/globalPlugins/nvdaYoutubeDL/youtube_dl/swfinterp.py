@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 
 import collections
 import io
+import threading
 import zlib
 
 from .compat import compat_str
@@ -177,6 +178,107 @@ class _Undefined(object):
 undefined = _Undefined()
 
 
+# Supported opcodes with their mnemonic and the kinds of their operands:
+# b - byte, u - u30, j - s24 jump offset, m - multiname index,
+# s - string constant index
+_OPCODES = {
+    9: ('label', ''),
+    16: ('jump', 'j'),
+    17: ('iftrue', 'j'),
+    18: ('iffalse', 'j'),
+    19: ('ifeq', 'j'),
+    20: ('ifne', 'j'),
+    21: ('iflt', 'j'),
+    32: ('pushnull', ''),
+    33: ('pushundefined', ''),
+    36: ('pushbyte', 'b'),
+    37: ('pushshort', 'u'),
+    38: ('pushtrue', ''),
+    39: ('pushfalse', ''),
+    40: ('pushnan', ''),
+    42: ('dup', ''),
+    44: ('pushstring', 's'),
+    48: ('pushscope', ''),
+    66: ('construct', 'u'),
+    70: ('callproperty', 'mu'),
+    71: ('returnvoid', ''),
+    72: ('returnvalue', ''),
+    73: ('constructsuper', 'u'),
+    74: ('constructproperty', 'mu'),
+    79: ('callpropvoid', 'mu'),
+    86: ('newarray', 'u'),
+    93: ('findpropstrict', 'm'),
+    94: ('findproperty', 'm'),
+    96: ('getlex', 'm'),
+    97: ('setproperty', 'm'),
+    98: ('getlocal', 'u'),
+    99: ('setlocal', 'u'),
+    102: ('getproperty', 'm'),
+    104: ('initproperty', 'm'),
+    115: ('convert_', ''),
+    128: ('coerce', 'u'),
+    130: ('coerce_a', ''),
+    133: ('coerce_s', ''),
+    147: ('decrement', ''),
+    149: ('typeof', ''),
+    160: ('add', ''),
+    161: ('subtract', ''),
+    162: ('multiply', ''),
+    164: ('modulo', ''),
+    168: ('bitand', ''),
+    171: ('equals', ''),
+    175: ('greaterequals', ''),
+    192: ('increment_i', ''),
+    208: ('getlocal_0', ''),
+    209: ('getlocal_1', ''),
+    210: ('getlocal_2', ''),
+    211: ('getlocal_3', ''),
+    212: ('setlocal_0', ''),
+    213: ('setlocal_1', ''),
+    214: ('setlocal_2', ''),
+    215: ('setlocal_3', ''),
+}
+
+# Operands of the other AVM2 opcodes, so that decoding can step over them;
+# 'w' is the variable-length operand list of lookupswitch. Opcodes missing
+# from both tables are assumed to have no operands.
+_UNSUPPORTED_OPERANDS = {
+    4: 'u', 5: 'u', 6: 'u', 8: 'u',
+    12: 'j', 13: 'j', 14: 'j', 15: 'j',
+    22: 'j', 23: 'j', 24: 'j', 25: 'j', 26: 'j', 27: 'w',
+    45: 'u', 46: 'u', 47: 'u', 49: 'u', 50: 'uu',
+    64: 'u', 65: 'u', 67: 'uu', 68: 'uu', 69: 'uu', 76: 'uu', 78: 'uu',
+    83: 'u', 85: 'u', 88: 'u', 89: 'u', 90: 'u', 95: 'u',
+    101: 'b', 106: 'u', 108: 'u', 109: 'u', 110: 'u', 111: 'u',
+    134: 'u', 146: 'u', 148: 'u', 178: 'u', 194: 'u', 195: 'u',
+    239: 'bubu', 240: 'u', 241: 'u',
+}
+
+
+_Method = collections.namedtuple('_Method', ['code', 'local_count'])
+
+
+class _Frame(object):
+    """ State of a running method """
+    __slots__ = ('avm_class', 'scopes', 'stack', 'registers')
+
+    def __init__(self, avm_class, scopes):
+        self.avm_class = avm_class
+        self.scopes = scopes
+        self.stack = []
+        self.registers = None
+
+
+class _Return(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+# Returned by instruction handlers of taken branches
+_JUMP = object()
+
+
 class SWFInterpreter(object):
     def __init__(self, file_contents):
         self._patched_functions = {
@@ -257,10 +359,6 @@ class SWFInterpreter(object):
 
         # Methods
         method_count = u30()
-        MethodInfo = collections.namedtuple(
-            'MethodInfo',
-            ['NEED_ARGUMENTS', 'NEED_REST'])
-        method_infos = []
         for method_id in range(method_count):
             param_count = u30()
             u30()  # return type
@@ -278,8 +376,6 @@ class SWFInterpreter(object):
                 # Param names present
                 for _ in range(param_count):
                     u30()  # param name
-            mi = MethodInfo(flags & 0x01 != 0, flags & 0x04 != 0)
-            method_infos.append(mi)
 
         # Metadata
         metadata_count = u30()
@@ -290,53 +386,12 @@ class SWFInterpreter(object):
                 u30()  # key
                 u30()  # value
 
-        def parse_traits_info():
-            trait_name_idx = u30()
-            kind_full = read_byte()
-            kind = kind_full & 0x0f
-            attrs = kind_full >> 4
-            methods = {}
-            constants = None
-            if kind == 0x00:  # Slot
-                u30()  # Slot id
-                u30()  # type_name_idx
-                vindex = u30()
-                if vindex != 0:
-                    read_byte()  # vkind
-            elif kind == 0x06:  # Const
-                u30()  # Slot id
-                u30()  # type_name_idx
-                vindex = u30()
-                vkind = 'any'
-                if vindex != 0:
-                    vkind = read_byte()
-                if vkind == 0x03:  # Constant_Int
-                    value = self.constant_ints[vindex]
-                elif vkind == 0x04:  # Constant_UInt
-                    value = self.constant_uints[vindex]
-                else:
-                    return {}, None  # Ignore silently for now
-                constants = {self.multinames[trait_name_idx]: value}
-            elif kind in (0x01, 0x02, 0x03):  # Method / Getter / Setter
-                u30()  # disp_id
-                method_idx = u30()
-                methods[self.multinames[trait_name_idx]] = method_idx
-            elif kind == 0x04:  # Class
-                u30()  # slot_id
-                u30()  # classi
-            elif kind == 0x05:  # Function
-                u30()  # slot_id
-                function_idx = u30()
-                methods[function_idx] = self.multinames[trait_name_idx]
-            else:
-                raise ExtractorError('Unsupported trait kind %d' % kind)
-
-            if attrs & 0x4 != 0:  # Metadata present
-                metadata_count = u30()
-                for _c3 in range(metadata_count):
-                    u30()  # metadata index
-
-            return methods, constants
+        # Classes, scripts and method bodies are only indexed here; the
+        # traits of a class and its method bodies are parsed when the class
+        # is first used (see _load_class). An interpreter is shared between
+        # threads, so the reader is only used with _lock held.
+        self._code_reader = code_reader
+        self._lock = threading.RLock()
 
         # Classes
         class_count = u30()
@@ -356,37 +411,30 @@ class SWFInterpreter(object):
             for _c2 in range(intrf_count):
                 u30()
             u30()  # iinit
-            trait_count = u30()
-            for _c2 in range(trait_count):
-                trait_methods, trait_constants = parse_traits_info()
-                avm_class.register_methods(trait_methods)
-                if trait_constants:
-                    avm_class.constants.update(trait_constants)
+            avm_class.traits_offsets = [code_reader.tell()]
+            self._skip_traits()
 
         assert len(classes) == class_count
         self._classes_by_name = dict((c.name, c) for c in classes)
+        self._unloaded_classes = set(classes)
 
         for avm_class in classes:
             avm_class.cinit_idx = u30()
-            trait_count = u30()
-            for _c2 in range(trait_count):
-                trait_methods, trait_constants = parse_traits_info()
-                avm_class.register_methods(trait_methods)
-                if trait_constants:
-                    avm_class.constants.update(trait_constants)
+            avm_class.traits_offsets.append(code_reader.tell())
+            self._skip_traits()
 
         # Scripts
         script_count = u30()
         for _c in range(script_count):
             u30()  # init
-            trait_count = u30()
-            for _c2 in range(trait_count):
-                parse_traits_info()
+            self._skip_traits()
 
         # Method bodies
         method_body_count = u30()
-        Method = collections.namedtuple('Method', ['code', 'local_count'])
+        # (code offset, code length, local count) of the method bodies, in
+        # file order and by method index
         self._all_methods = []
+        self._method_bodies = {}
         for _c in range(method_body_count):
             method_idx = u30()
             u30()  # max_stack
@@ -394,12 +442,10 @@ class SWFInterpreter(object):
             u30()  # init_scope_depth
             u30()  # max_scope_depth
             code_length = u30()
-            code = read_bytes(code_length)
-            m = Method(code, local_count)
-            self._all_methods.append(m)
-            for avm_class in classes:
-                if method_idx in avm_class.method_idxs:
-                    avm_class.methods[avm_class.method_idxs[method_idx]] = m
+            body = (code_reader.tell(), code_length, local_count)
+            read_bytes(code_length)
+            self._all_methods.append(body)
+            self._method_bodies[method_idx] = body
             exception_count = u30()
             for _c2 in range(exception_count):
                 u30()  # from
@@ -407,12 +453,93 @@ class SWFInterpreter(object):
                 u30()  # target
                 u30()  # exc_type
                 u30()  # var_name
-            trait_count = u30()
-            for _c2 in range(trait_count):
-                parse_traits_info()
+            self._skip_traits()
 
         assert p + code_reader.tell() == len(code_tag)
 
+    def _parse_traits_info(self):
+        code_reader = self._code_reader
+        trait_name_idx = _u30(code_reader)
+        kind_full = _read_byte(code_reader)
+        kind = kind_full & 0x0f
+        attrs = kind_full >> 4
+        methods = {}
+        constants = None
+        if kind == 0x00:  # Slot
+            _u30(code_reader)  # Slot id
+            _u30(code_reader)  # type_name_idx
+            vindex = _u30(code_reader)
+            if vindex != 0:
+                _read_byte(code_reader)  # vkind
+        elif kind == 0x06:  # Const
+            _u30(code_reader)  # Slot id
+            _u30(code_reader)  # type_name_idx
+            vindex = _u30(code_reader)
+            vkind = 'any'
+            if vindex != 0:
+                vkind = _read_byte(code_reader)
+            if vkind == 0x03:  # Constant_Int
+                value = self.constant_ints[vindex]
+            elif vkind == 0x04:  # Constant_UInt
+                value = self.constant_uints[vindex]
+            else:
+                return {}, None  # Ignore silently for now
+            constants = {self.multinames[trait_name_idx]: value}
+        elif kind in (0x01, 0x02, 0x03):  # Method / Getter / Setter
+            _u30(code_reader)  # disp_id
+            method_idx = _u30(code_reader)
+            methods[self.multinames[trait_name_idx]] = method_idx
+        elif kind == 0x04:  # Class
+            _u30(code_reader)  # slot_id
+            _u30(code_reader)  # classi
+        elif kind == 0x05:  # Function
+            _u30(code_reader)  # slot_id
+            function_idx = _u30(code_reader)
+            methods[function_idx] = self.multinames[trait_name_idx]
+        else:
+            raise ExtractorError('Unsupported trait kind %d' % kind)
+
+        if attrs & 0x4 != 0:  # Metadata present
+            metadata_count = _u30(code_reader)
+            for _c3 in range(metadata_count):
+                _u30(code_reader)  # metadata index
+
+        return methods, constants
+
+    def _skip_traits(self):
+        trait_count = _u30(self._code_reader)
+        for _c in range(trait_count):
+            self._parse_traits_info()
+
+    def _read_method(self, body):
+        offset, code_length, local_count = body
+        with self._lock:
+            self._code_reader.seek(offset)
+            return _Method(
+                _read_bytes(code_length, self._code_reader), local_count)
+
+    def _load_class(self, avm_class):
+        """ Parse the traits and method bodies of avm_class """
+        if avm_class not in self._unloaded_classes:
+            return
+        with self._lock:
+            if avm_class not in self._unloaded_classes:
+                return
+            for offset in avm_class.traits_offsets:
+                self._code_reader.seek(offset)
+                trait_count = _u30(self._code_reader)
+                for _c in range(trait_count):
+                    trait_methods, trait_constants = self._parse_traits_info()
+                    avm_class.register_methods(trait_methods)
+                    if trait_constants:
+                        avm_class.constants.update(trait_constants)
+            for method_idx, method_name in avm_class.method_idxs.items():
+                body = self._method_bodies.get(method_idx)
+                if body is not None:
+                    avm_class.methods[method_name] = self._read_method(body)
+            # Only now may other threads use the class without waiting
+            self._unloaded_classes.remove(avm_class)
+
     def patch_function(self, avm_class, func_name, f):
         self._patched_functions[(avm_class, func_name)] = f
 
@@ -421,10 +548,11 @@ class SWFInterpreter(object):
             res = self._classes_by_name[class_name]
         except KeyError:
             raise ExtractorError('Class %r not found' % class_name)
+        self._load_class(res)
 
         if call_cinit and hasattr(res, 'cinit_idx'):
             res.register_methods({'$cinit': res.cinit_idx})
-            res.methods['$cinit'] = self._all_methods[res.cinit_idx]
+            res.methods['$cinit'] = self._read_method(self._all_methods[res.cinit_idx])
             cinit = self.extract_function(res, '$cinit')
             cinit([])
 
@@ -438,392 +566,450 @@ class SWFInterpreter(object):
             return avm_class.method_pyfunctions[func_name]
         if func_name in self._classes_by_name:
             return self._classes_by_name[func_name].make_object()
+        self._load_class(avm_class)
         if func_name not in avm_class.methods:
             raise ExtractorError('Cannot find function %s.%s' % (
                 avm_class.name, func_name))
         m = avm_class.methods[func_name]
+        instructions = []
 
         def resfunc(args):
-            # Helper functions
-            coder = io.BytesIO(m.code)
-            s24 = lambda: _s24(coder)
-            u30 = lambda: _u30(coder)
-
-            registers = [avm_class.variables] + list(args) + [None] * m.local_count
-            stack = []
-            scopes = collections.deque([
-                self._classes_by_name, avm_class.constants, avm_class.variables])
+            if not instructions:
+                # The method body is only decoded on the first call
+                with self._lock:
+                    if not instructions:
+                        instructions.extend(self._decode_method(m.code))
+
+            frame = _Frame(avm_class, collections.deque([
+                self._classes_by_name, avm_class.constants, avm_class.variables]))
+            frame.registers = [avm_class.variables] + list(args) + [None] * m.local_count
+            pc = 0
             while True:
-                opcode = _read_byte(coder)
-                if opcode == 9:  # label
-                    pass  # Spec says: "Do nothing."
-                elif opcode == 16:  # jump
-                    offset = s24()
-                    coder.seek(coder.tell() + offset)
-                elif opcode == 17:  # iftrue
-                    offset = s24()
-                    value = stack.pop()
-                    if value:
-                        coder.seek(coder.tell() + offset)
-                elif opcode == 18:  # iffalse
-                    offset = s24()
-                    value = stack.pop()
-                    if not value:
-                        coder.seek(coder.tell() + offset)
-                elif opcode == 19:  # ifeq
-                    offset = s24()
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    if value2 == value1:
-                        coder.seek(coder.tell() + offset)
-                elif opcode == 20:  # ifne
-                    offset = s24()
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    if value2 != value1:
-                        coder.seek(coder.tell() + offset)
-                elif opcode == 21:  # iflt
-                    offset = s24()
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    if value1 < value2:
-                        coder.seek(coder.tell() + offset)
-                elif opcode == 32:  # pushnull
-                    stack.append(None)
-                elif opcode == 33:  # pushundefined
-                    stack.append(undefined)
-                elif opcode == 36:  # pushbyte
-                    v = _read_byte(coder)
-                    stack.append(v)
-                elif opcode == 37:  # pushshort
-                    v = u30()
-                    stack.append(v)
-                elif opcode == 38:  # pushtrue
-                    stack.append(True)
-                elif opcode == 39:  # pushfalse
-                    stack.append(False)
-                elif opcode == 40:  # pushnan
-                    stack.append(float('NaN'))
-                elif opcode == 42:  # dup
-                    value = stack[-1]
-                    stack.append(value)
-                elif opcode == 44:  # pushstring
-                    idx = u30()
-                    stack.append(self.constant_strings[idx])
-                elif opcode == 48:  # pushscope
-                    new_scope = stack.pop()
-                    scopes.append(new_scope)
-                elif opcode == 66:  # construct
-                    arg_count = u30()
-                    args = list(reversed(
-                        [stack.pop() for _ in range(arg_count)]))
-                    obj = stack.pop()
-                    res = obj.avm_class.make_object()
-                    stack.append(res)
-                elif opcode == 70:  # callproperty
-                    index = u30()
-                    mname = self.multinames[index]
-                    arg_count = u30()
-                    args = list(reversed(
-                        [stack.pop() for _ in range(arg_count)]))
-                    obj = stack.pop()
-
-                    if obj == StringClass:
-                        if mname == 'String':
-                            assert len(args) == 1
-                            assert isinstance(args[0], (
-                                int, compat_str, _Undefined))
-                            if args[0] == undefined:
-                                res = 'undefined'
-                            else:
-                                res = compat_str(args[0])
-                            stack.append(res)
-                            continue
-                        else:
-                            raise NotImplementedError(
-                                'Function String.%s is not yet implemented'
-                                % mname)
-                    elif isinstance(obj, _AVMClass_Object):
-                        func = self.extract_function(obj.avm_class, mname)
-                        res = func(args)
-                        stack.append(res)
-                        continue
-                    elif isinstance(obj, _AVMClass):
-                        func = self.extract_function(obj, mname)
-                        res = func(args)
-                        stack.append(res)
-                        continue
-                    elif isinstance(obj, _ScopeDict):
-                        if mname in obj.avm_class.method_names:
-                            func = self.extract_function(obj.avm_class, mname)
-                            res = func(args)
-                        else:
-                            res = obj[mname]
-                        stack.append(res)
-                        continue
-                    elif isinstance(obj, compat_str):
-                        if mname == 'split':
-                            assert len(args) == 1
-                            assert isinstance(args[0], compat_str)
-                            if args[0] == '':
-                                res = list(obj)
-                            else:
-                                res = obj.split(args[0])
-                            stack.append(res)
-                            continue
-                        elif mname == 'charCodeAt':
-                            assert len(args) <= 1
-                            idx = 0 if len(args) == 0 else args[0]
-                            assert isinstance(idx, int)
-                            res = ord(obj[idx])
-                            stack.append(res)
-                            continue
-                    elif isinstance(obj, list):
-                        if mname == 'slice':
-                            assert len(args) == 1
-                            assert isinstance(args[0], int)
-                            res = obj[args[0]:]
-                            stack.append(res)
-                            continue
-                        elif mname == 'join':
-                            assert len(args) == 1
-                            assert isinstance(args[0], compat_str)
-                            res = args[0].join(obj)
-                            stack.append(res)
-                            continue
-                    raise NotImplementedError(
-                        'Unsupported property %r on %r'
-                        % (mname, obj))
-                elif opcode == 71:  # returnvoid
-                    res = undefined
-                    return res
-                elif opcode == 72:  # returnvalue
-                    res = stack.pop()
-                    return res
-                elif opcode == 73:  # constructsuper
-                    # Not yet implemented, just hope it works without it
-                    arg_count = u30()
-                    args = list(reversed(
-                        [stack.pop() for _ in range(arg_count)]))
-                    obj = stack.pop()
-                elif opcode == 74:  # constructproperty
-                    index = u30()
-                    arg_count = u30()
-                    args = list(reversed(
-                        [stack.pop() for _ in range(arg_count)]))
-                    obj = stack.pop()
-
-                    mname = self.multinames[index]
-                    assert isinstance(obj, _AVMClass)
-
-                    # We do not actually call the constructor for now;
-                    # we just pretend it does nothing
-                    stack.append(obj.make_object())
-                elif opcode == 79:  # callpropvoid
-                    index = u30()
-                    mname = self.multinames[index]
-                    arg_count = u30()
-                    args = list(reversed(
-                        [stack.pop() for _ in range(arg_count)]))
-                    obj = stack.pop()
-                    if isinstance(obj, _AVMClass_Object):
-                        func = self.extract_function(obj.avm_class, mname)
-                        res = func(args)
-                        assert res is undefined
-                        continue
-                    if isinstance(obj, _ScopeDict):
-                        assert mname in obj.avm_class.method_names
-                        func = self.extract_function(obj.avm_class, mname)
-                        res = func(args)
-                        assert res is undefined
-                        continue
-                    if mname == 'reverse':
-                        assert isinstance(obj, list)
-                        obj.reverse()
-                    else:
-                        raise NotImplementedError(
-                            'Unsupported (void) property %r on %r'
-                            % (mname, obj))
-                elif opcode == 86:  # newarray
-                    arg_count = u30()
-                    arr = []
-                    for i in range(arg_count):
-                        arr.append(stack.pop())
-                    arr = arr[::-1]
-                    stack.append(arr)
-                elif opcode == 93:  # findpropstrict
-                    index = u30()
-                    mname = self.multinames[index]
-                    for s in reversed(scopes):
-                        if mname in s:
-                            res = s
-                            break
-                    else:
-                        res = scopes[0]
-                    if mname not in res and mname in _builtin_classes:
-                        stack.append(_builtin_classes[mname])
-                    else:
-                        stack.append(res[mname])
-                elif opcode == 94:  # findproperty
-                    index = u30()
-                    mname = self.multinames[index]
-                    for s in reversed(scopes):
-                        if mname in s:
-                            res = s
-                            break
-                    else:
-                        res = avm_class.variables
-                    stack.append(res)
-                elif opcode == 96:  # getlex
-                    index = u30()
-                    mname = self.multinames[index]
-                    for s in reversed(scopes):
-                        if mname in s:
-                            scope = s
-                            break
-                    else:
-                        scope = avm_class.variables
-
-                    if mname in scope:
-                        res = scope[mname]
-                    elif mname in _builtin_classes:
-                        res = _builtin_classes[mname]
-                    else:
-                        # Assume unitialized
-                        # TODO warn here
-                        res = undefined
-                    stack.append(res)
-                elif opcode == 97:  # setproperty
-                    index = u30()
-                    value = stack.pop()
-                    idx = self.multinames[index]
-                    if isinstance(idx, _Multiname):
-                        idx = stack.pop()
-                    obj = stack.pop()
-                    obj[idx] = value
-                elif opcode == 98:  # getlocal
-                    index = u30()
-                    stack.append(registers[index])
-                elif opcode == 99:  # setlocal
-                    index = u30()
-                    value = stack.pop()
-                    registers[index] = value
-                elif opcode == 102:  # getproperty
-                    index = u30()
-                    pname = self.multinames[index]
-                    if pname == 'length':
-                        obj = stack.pop()
-                        assert isinstance(obj, (compat_str, list))
-                        stack.append(len(obj))
-                    elif isinstance(pname, compat_str):  # Member access
-                        obj = stack.pop()
-                        if isinstance(obj, _AVMClass):
-                            res = obj.static_properties[pname]
-                            stack.append(res)
-                            continue
-
-                        assert isinstance(obj, (dict, _ScopeDict)),\
-                            'Accessing member %r on %r' % (pname, obj)
-                        res = obj.get(pname, undefined)
-                        stack.append(res)
-                    else:  # Assume attribute access
-                        idx = stack.pop()
-                        assert isinstance(idx, int)
-                        obj = stack.pop()
-                        assert isinstance(obj, list)
-                        stack.append(obj[idx])
-                elif opcode == 104:  # initproperty
-                    index = u30()
-                    value = stack.pop()
-                    idx = self.multinames[index]
-                    if isinstance(idx, _Multiname):
-                        idx = stack.pop()
-                    obj = stack.pop()
-                    obj[idx] = value
-                elif opcode == 115:  # convert_
-                    value = stack.pop()
-                    intvalue = int(value)
-                    stack.append(intvalue)
-                elif opcode == 128:  # coerce
-                    u30()
-                elif opcode == 130:  # coerce_a
-                    value = stack.pop()
-                    # um, yes, it's any value
-                    stack.append(value)
-                elif opcode == 133:  # coerce_s
-                    assert isinstance(stack[-1], (type(None), compat_str))
-                elif opcode == 147:  # decrement
-                    value = stack.pop()
-                    assert isinstance(value, int)
-                    stack.append(value - 1)
-                elif opcode == 149:  # typeof
-                    value = stack.pop()
-                    return {
-                        _Undefined: 'undefined',
-                        compat_str: 'String',
-                        int: 'Number',
-                        float: 'Number',
-                    }[type(value)]
-                elif opcode == 160:  # add
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    res = value1 + value2
-                    stack.append(res)
-                elif opcode == 161:  # subtract
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    res = value1 - value2
-                    stack.append(res)
-                elif opcode == 162:  # multiply
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    res = value1 * value2
-                    stack.append(res)
-                elif opcode == 164:  # modulo
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    res = value1 % value2
-                    stack.append(res)
-                elif opcode == 168:  # bitand
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    assert isinstance(value1, int)
-                    assert isinstance(value2, int)
-                    res = value1 & value2
-                    stack.append(res)
-                elif opcode == 171:  # equals
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    result = value1 == value2
-                    stack.append(result)
-                elif opcode == 175:  # greaterequals
-                    value2 = stack.pop()
-                    value1 = stack.pop()
-                    result = value1 >= value2
-                    stack.append(result)
-                elif opcode == 192:  # increment_i
-                    value = stack.pop()
-                    assert isinstance(value, int)
-                    stack.append(value + 1)
-                elif opcode == 208:  # getlocal_0
-                    stack.append(registers[0])
-                elif opcode == 209:  # getlocal_1
-                    stack.append(registers[1])
-                elif opcode == 210:  # getlocal_2
-                    stack.append(registers[2])
-                elif opcode == 211:  # getlocal_3
-                    stack.append(registers[3])
-                elif opcode == 212:  # setlocal_0
-                    registers[0] = stack.pop()
-                elif opcode == 213:  # setlocal_1
-                    registers[1] = stack.pop()
-                elif opcode == 214:  # setlocal_2
-                    registers[2] = stack.pop()
-                elif opcode == 215:  # setlocal_3
-                    registers[3] = stack.pop()
-                else:
-                    raise NotImplementedError(
-                        'Unsupported opcode %d' % opcode)
+                handler, operands, target = instructions[pc]
+                pc += 1
+                res = handler(frame, *operands)
+                if res is None:
+                    continue
+                if res is not _JUMP:
+                    return res.value
+                if target is None:
+                    raise ExtractorError('Invalid jump target in %s.%s' % (
+                        avm_class.name, func_name))
+                pc = target
 
         avm_class.method_pyfunctions[func_name] = resfunc
         return resfunc
+
+    def _decode_method(self, code):
+        """
+        Decode the bytecode of a method body into a list of
+        (handler, operands, target) tuples, where target is the index of
+        the instruction a branch jumps to.
+        """
+        coder = io.BytesIO(code)
+        instructions = []
+        offsets = {}
+        jumps = []
+        while coder.tell() < len(code):
+            offsets[coder.tell()] = len(instructions)
+            opcode = _read_byte(coder)
+            op = _OPCODES.get(opcode)
+            if op is None:
+                # Executing an unsupported opcode raises, but the code after
+                # it may still be reached through jumps
+                instructions.append((self._op_unsupported, (opcode,), None))
+                for kind in _UNSUPPORTED_OPERANDS.get(opcode, ''):
+                    if kind == 'b':
+                        _read_byte(coder)
+                    elif kind == 'j':
+                        _s24(coder)
+                    elif kind == 'w':
+                        _s24(coder)
+                        for _ in range(_u30(coder) + 1):
+                            _s24(coder)
+                    else:
+                        _u30(coder)
+                continue
+            name, operand_kinds = op
+            operands = []
+            for kind in operand_kinds:
+                if kind == 'b':
+                    operands.append(_read_byte(coder))
+                elif kind == 'j':
+                    offset = _s24(coder)
+                    jumps.append((len(instructions), coder.tell() + offset))
+                elif kind == 'm':
+                    operands.append(self.multinames[_u30(coder)])
+                elif kind == 's':
+                    operands.append(self.constant_strings[_u30(coder)])
+                else:
+                    operands.append(_u30(coder))
+            instructions.append((getattr(self, '_op_' + name), tuple(operands), None))
+        for idx, target_offset in jumps:
+            handler, operands, _ = instructions[idx]
+            instructions[idx] = (handler, operands, offsets.get(target_offset))
+        return instructions
+
+    def _call_method(self, avm_class, mname, args):
+        func = self.extract_function(avm_class, mname)
+        return func(args)
+
+    @staticmethod
+    def _pop_args(stack, arg_count):
+        return list(reversed([stack.pop() for _ in range(arg_count)]))
+
+    # Instruction handlers. Each receives the frame of the running method
+    # and the decoded operands of the instruction; branches return _JUMP
+    # when taken and return instructions a _Return.
+
+    def _op_unsupported(self, frame, opcode):
+        raise NotImplementedError('Unsupported opcode %d' % opcode)
+
+    def _op_label(self, frame):
+        pass  # Spec says: "Do nothing."
+
+    def _op_jump(self, frame):
+        return _JUMP
+
+    def _op_iftrue(self, frame):
+        value = frame.stack.pop()
+        if value:
+            return _JUMP
+
+    def _op_iffalse(self, frame):
+        value = frame.stack.pop()
+        if not value:
+            return _JUMP
+
+    def _op_ifeq(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        if value2 == value1:
+            return _JUMP
+
+    def _op_ifne(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        if value2 != value1:
+            return _JUMP
+
+    def _op_iflt(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        if value1 < value2:
+            return _JUMP
+
+    def _op_pushnull(self, frame):
+        frame.stack.append(None)
+
+    def _op_pushundefined(self, frame):
+        frame.stack.append(undefined)
+
+    def _op_pushbyte(self, frame, v):
+        frame.stack.append(v)
+
+    def _op_pushshort(self, frame, v):
+        frame.stack.append(v)
+
+    def _op_pushtrue(self, frame):
+        frame.stack.append(True)
+
+    def _op_pushfalse(self, frame):
+        frame.stack.append(False)
+
+    def _op_pushnan(self, frame):
+        frame.stack.append(float('NaN'))
+
+    def _op_dup(self, frame):
+        frame.stack.append(frame.stack[-1])
+
+    def _op_pushstring(self, frame, s):
+        frame.stack.append(s)
+
+    def _op_pushscope(self, frame):
+        frame.scopes.append(frame.stack.pop())
+
+    def _op_construct(self, frame, arg_count):
+        stack = frame.stack
+        self._pop_args(stack, arg_count)
+        obj = stack.pop()
+        stack.append(obj.avm_class.make_object())
+
+    def _op_callproperty(self, frame, mname, arg_count):
+        stack = frame.stack
+        args = self._pop_args(stack, arg_count)
+        obj = stack.pop()
+
+        if obj == StringClass:
+            if mname == 'String':
+                assert len(args) == 1
+                assert isinstance(args[0], (
+                    int, compat_str, _Undefined))
+                if args[0] == undefined:
+                    res = 'undefined'
+                else:
+                    res = compat_str(args[0])
+                stack.append(res)
+                return
+            else:
+                raise NotImplementedError(
+                    'Function String.%s is not yet implemented'
+                    % mname)
+        elif isinstance(obj, _AVMClass_Object):
+            stack.append(self._call_method(obj.avm_class, mname, args))
+            return
+        elif isinstance(obj, _AVMClass):
+            stack.append(self._call_method(obj, mname, args))
+            return
+        elif isinstance(obj, _ScopeDict):
+            if mname in obj.avm_class.method_names:
+                res = self._call_method(obj.avm_class, mname, args)
+            else:
+                res = obj[mname]
+            stack.append(res)
+            return
+        elif isinstance(obj, compat_str):
+            if mname == 'split':
+                assert len(args) == 1
+                assert isinstance(args[0], compat_str)
+                if args[0] == '':
+                    res = list(obj)
+                else:
+                    res = obj.split(args[0])
+                stack.append(res)
+                return
+            elif mname == 'charCodeAt':
+                assert len(args) <= 1
+                idx = 0 if len(args) == 0 else args[0]
+                assert isinstance(idx, int)
+                stack.append(ord(obj[idx]))
+                return
+        elif isinstance(obj, list):
+            if mname == 'slice':
+                assert len(args) == 1
+                assert isinstance(args[0], int)
+                stack.append(obj[args[0]:])
+                return
+            elif mname == 'join':
+                assert len(args) == 1
+                assert isinstance(args[0], compat_str)
+                stack.append(args[0].join(obj))
+                return
+        raise NotImplementedError(
+            'Unsupported property %r on %r'
+            % (mname, obj))
+
+    def _op_returnvoid(self, frame):
+        return _Return(undefined)
+
+    def _op_returnvalue(self, frame):
+        return _Return(frame.stack.pop())
+
+    def _op_constructsuper(self, frame, arg_count):
+        # Not yet implemented, just hope it works without it
+        self._pop_args(frame.stack, arg_count)
+        frame.stack.pop()
+
+    def _op_constructproperty(self, frame, mname, arg_count):
+        stack = frame.stack
+        self._pop_args(stack, arg_count)
+        obj = stack.pop()
+        assert isinstance(obj, _AVMClass)
+
+        # We do not actually call the constructor for now;
+        # we just pretend it does nothing
+        stack.append(obj.make_object())
+
+    def _op_callpropvoid(self, frame, mname, arg_count):
+        stack = frame.stack
+        args = self._pop_args(stack, arg_count)
+        obj = stack.pop()
+        if isinstance(obj, _AVMClass_Object):
+            res = self._call_method(obj.avm_class, mname, args)
+            assert res is undefined
+            return
+        if isinstance(obj, _ScopeDict):
+            assert mname in obj.avm_class.method_names
+            res = self._call_method(obj.avm_class, mname, args)
+            assert res is undefined
+            return
+        if mname == 'reverse':
+            assert isinstance(obj, list)
+            obj.reverse()
+        else:
+            raise NotImplementedError(
+                'Unsupported (void) property %r on %r'
+                % (mname, obj))
+
+    def _op_newarray(self, frame, arg_count):
+        frame.stack.append(self._pop_args(frame.stack, arg_count))
+
+    def _op_findpropstrict(self, frame, mname):
+        scopes = frame.scopes
+        for s in reversed(scopes):
+            if mname in s:
+                res = s
+                break
+        else:
+            res = scopes[0]
+        if mname not in res and mname in _builtin_classes:
+            frame.stack.append(_builtin_classes[mname])
+        else:
+            frame.stack.append(res[mname])
+
+    def _op_findproperty(self, frame, mname):
+        for s in reversed(frame.scopes):
+            if mname in s:
+                res = s
+                break
+        else:
+            res = frame.avm_class.variables
+        frame.stack.append(res)
+
+    def _op_getlex(self, frame, mname):
+        for s in reversed(frame.scopes):
+            if mname in s:
+                scope = s
+                break
+        else:
+            scope = frame.avm_class.variables
+
+        if mname in scope:
+            res = scope[mname]
+        elif mname in _builtin_classes:
+            res = _builtin_classes[mname]
+        else:
+            # Assume unitialized
+            # TODO warn here
+            res = undefined
+        frame.stack.append(res)
+
+    def _op_setproperty(self, frame, idx):
+        stack = frame.stack
+        value = stack.pop()
+        if isinstance(idx, _Multiname):
+            idx = stack.pop()
+        obj = stack.pop()
+        obj[idx] = value
+
+    def _op_getlocal(self, frame, index):
+        frame.stack.append(frame.registers[index])
+
+    def _op_setlocal(self, frame, index):
+        frame.registers[index] = frame.stack.pop()
+
+    def _op_getproperty(self, frame, pname):
+        stack = frame.stack
+        if pname == 'length':
+            obj = stack.pop()
+            assert isinstance(obj, (compat_str, list))
+            stack.append(len(obj))
+        elif isinstance(pname, compat_str):  # Member access
+            obj = stack.pop()
+            if isinstance(obj, _AVMClass):
+                stack.append(obj.static_properties[pname])
+                return
+
+            assert isinstance(obj, (dict, _ScopeDict)),\
+                'Accessing member %r on %r' % (pname, obj)
+            stack.append(obj.get(pname, undefined))
+        else:  # Assume attribute access
+            idx = stack.pop()
+            assert isinstance(idx, int)
+            obj = stack.pop()
+            assert isinstance(obj, list)
+            stack.append(obj[idx])
+
+    _op_initproperty = _op_setproperty
+
+    def _op_convert_(self, frame):
+        frame.stack.append(int(frame.stack.pop()))
+
+    def _op_coerce(self, frame, index):
+        pass
+
+    def _op_coerce_a(self, frame):
+        pass  # um, yes, it's any value
+
+    def _op_coerce_s(self, frame):
+        assert isinstance(frame.stack[-1], (type(None), compat_str))
+
+    def _op_decrement(self, frame):
+        value = frame.stack.pop()
+        assert isinstance(value, int)
+        frame.stack.append(value - 1)
+
+    def _op_typeof(self, frame):
+        value = frame.stack.pop()
+        return _Return({
+            _Undefined: 'undefined',
+            compat_str: 'String',
+            int: 'Number',
+            float: 'Number',
+        }[type(value)])
+
+    def _op_add(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        frame.stack.append(value1 + value2)
+
+    def _op_subtract(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        frame.stack.append(value1 - value2)
+
+    def _op_multiply(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        frame.stack.append(value1 * value2)
+
+    def _op_modulo(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        frame.stack.append(value1 % value2)
+
+    def _op_bitand(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        assert isinstance(value1, int)
+        assert isinstance(value2, int)
+        frame.stack.append(value1 & value2)
+
+    def _op_equals(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        frame.stack.append(value1 == value2)
+
+    def _op_greaterequals(self, frame):
+        value2 = frame.stack.pop()
+        value1 = frame.stack.pop()
+        frame.stack.append(value1 >= value2)
+
+    def _op_increment_i(self, frame):
+        value = frame.stack.pop()
+        assert isinstance(value, int)
+        frame.stack.append(value + 1)
+
+    def _op_getlocal_0(self, frame):
+        frame.stack.append(frame.registers[0])
+
+    def _op_getlocal_1(self, frame):
+        frame.stack.append(frame.registers[1])
+
+    def _op_getlocal_2(self, frame):
+        frame.stack.append(frame.registers[2])
+
+    def _op_getlocal_3(self, frame):
+        frame.stack.append(frame.registers[3])
+
+    def _op_setlocal_0(self, frame):
+        frame.registers[0] = frame.stack.pop()
+
+    def _op_setlocal_1(self, frame):
+        frame.registers[1] = frame.stack.pop()
+
+    def _op_setlocal_2(self, frame):
+        frame.registers[2] = frame.stack.pop()
+
+    def _op_setlocal_3(self, frame):
+        frame.registers[3] = frame.stack.pop()
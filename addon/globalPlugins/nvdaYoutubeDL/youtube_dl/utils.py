@@ -6,6 +6,7 @@ from __future__ import unicode_literals
 import base64
 import calendar
 import codecs
+import collections
 import contextlib
 import ctypes
 import datetime
@@ -29,6 +30,7 @@ import struct
 import subprocess
 import sys
 import tempfile
+import threading
 import traceback
 import xml.etree.ElementTree
 import zlib
@@ -36,7 +38,6 @@ import zlib
 from .compat import (
     compat_basestring,
     compat_chr,
-    compat_etree_fromstring,
     compat_html_entities,
     compat_http_client,
     compat_kwargs,
@@ -317,32 +318,49 @@ def timeconvert(timestr):
     return timestamp
 
 
+def _sanitize_filename_char(char, restricted):
+    if char == '?' or ord(char) < 32 or ord(char) == 127:
+        return ''
+    elif char == '"':
+        return '' if restricted else '\''
+    elif char == ':':
+        return '_-' if restricted else ' -'
+    elif char in '\\/|*<>':
+        return '_'
+    if restricted and (char in '!&\'()[]{}$;`^,#' or char.isspace()):
+        return '_'
+    if restricted and ord(char) > 127:
+        return '_'
+    return char
+
+
+# Translation tables of sanitize_filename for ASCII characters, indexed by
+# the restricted flag; non-ASCII characters are only replaced in restricted mode
+_SANITIZE_FILENAME_TABLES = dict(
+    (restricted, dict(
+        (i, _sanitize_filename_char(compat_chr(i), restricted)) for i in range(128)))
+    for restricted in (False, True))
+_TIMESTAMP_RE = re.compile(r'[0-9]+(?::[0-9]+)+')
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7f]')
+_UNDERSCORES_RE = re.compile(r'_{2,}')
+
+
 def sanitize_filename(s, restricted=False, is_id=False):
     """Sanitizes a string so it could be used as part of a filename.
     If restricted is set, use a stricter subset of allowed characters.
     Set is_id if this is not an arbitrary string, but an ID that should be kept if possible
     """
-    def replace_insane(char):
-        if char == '?' or ord(char) < 32 or ord(char) == 127:
-            return ''
-        elif char == '"':
-            return '' if restricted else '\''
-        elif char == ':':
-            return '_-' if restricted else ' -'
-        elif char in '\\/|*<>':
-            return '_'
-        if restricted and (char in '!&\'()[]{}$;`^,#' or char.isspace()):
-            return '_'
-        if restricted and ord(char) > 127:
-            return '_'
-        return char
-
+    restricted = bool(restricted)
     # Handle timestamps
-    s = re.sub(r'[0-9]+(?::[0-9]+)+', lambda m: m.group(0).replace(':', '_'), s)
-    result = ''.join(map(replace_insane, s))
+    s = _TIMESTAMP_RE.sub(lambda m: m.group(0).replace(':', '_'), s)
+    if isinstance(s, compat_str):
+        result = s.translate(_SANITIZE_FILENAME_TABLES[restricted])
+        if restricted:
+            result = _NON_ASCII_RE.sub('_', result)
+    else:
+        result = ''.join(_sanitize_filename_char(char, restricted) for char in s)
     if not is_id:
-        while '__' in result:
-            result = result.replace('__', '_')
+        result = _UNDERSCORES_RE.sub('_', result)
         result = result.strip('_')
         # Common case of "Foreign band name - English song title"
         if restricted and result.startswith('-_'):
@@ -1251,6 +1269,69 @@ class locked_file(object):
         return self.f.read(*args)
 
 
+class DownloadArchive(object):
+    """ In-memory index of a download archive file
+
+    The file may be shared with other processes. Lookups read only what was
+    appended to the file since the previous lookup, without taking a lock.
+    A recorded id is appended right away under an exclusive lock, so that
+    it survives the process being killed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._ids = set()
+        # Number of bytes of the file that are in _ids
+        self._offset = 0
+        # Last line of the file if it is not terminated yet
+        self._partial_id = None
+        self._lock = threading.Lock()
+
+    def _read_appended(self):
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError as ose:
+            if ose.errno != errno.ENOENT:
+                raise
+            return
+        if size < self._offset:
+            # The file was truncated or replaced, read it again
+            self._ids = set()
+            self._offset = 0
+        if size == self._offset:
+            return
+        try:
+            with io.open(self.filename, 'rb') as archive_file:
+                archive_file.seek(self._offset)
+                data = archive_file.read(size - self._offset)
+        except IOError:
+            if os.name != 'nt':
+                raise
+            # Windows does not allow reading a region locked by another
+            # process, so wait for the lock
+            with locked_file(self.filename, 'r', encoding='utf-8') as archive_file:
+                archive_file.f.buffer.seek(self._offset)
+                data = archive_file.f.buffer.read(size - self._offset)
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].split(b'\n'):
+            self._ids.add(line.decode('utf-8').strip())
+        self._offset += end
+        self._partial_id = data[end:].decode('utf-8').strip() or None
+
+    def __contains__(self, vid_id):
+        with self._lock:
+            if vid_id in self._ids:
+                return True
+            self._read_appended()
+            return vid_id in self._ids or vid_id == self._partial_id
+
+    def add(self, vid_id):
+        with self._lock:
+            with locked_file(self.filename, 'a', encoding='utf-8') as archive_file:
+                archive_file.write(vid_id + '\n')
+            self._ids.add(vid_id)
+
+
 def get_filesystem_encoding():
     encoding = sys.getfilesystemencoding()
     return encoding if encoding is not None else 'utf-8'
@@ -1557,11 +1638,103 @@ def detect_exe_version(output, version_re=None, unrecognized='present'):
         return unrecognized
 
 
+class BackgroundCall(object):
+    """ Run func(*args, **kwargs) in a daemon thread
+
+    result() waits for the call to finish and returns its return value, or
+    re-raises its exception in the calling thread. Calls whose result is
+    never requested are simply left to finish on their own.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self._result = None
+        self._exception = None
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._result = func(*args, **kwargs)
+        except BaseException as e:
+            self._exception = e
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def wait(self):
+        """ Wait for the call to finish, ignoring its result """
+        self._thread.join()
+
+    def result(self):
+        self._thread.join()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+def parallel_map(func, iterable, max_workers=4, wait_on_close=False):
+    """ Like map(), but with up to max_workers calls of func running at once
+
+    Results are yielded in the order of iterable. Items are only taken from
+    iterable when a worker is free, so a consumer that stops early and
+    closes the generator leaves at most max_workers calls behind. Their
+    results and exceptions are discarded; with wait_on_close, closing the
+    generator waits for them to finish.
+    """
+    calls = collections.deque()
+    try:
+        for item in iterable:
+            calls.append(BackgroundCall(func, item))
+            if len(calls) >= max_workers:
+                yield calls.popleft().result()
+        while calls:
+            yield calls.popleft().result()
+    finally:
+        if wait_on_close:
+            for call in calls:
+                call.wait()
+
+
 class PagedList(object):
+    # Number of pages requested at once
+    _PAGE_WORKERS = 4
+
     def __len__(self):
         # This is only useful for tests
         return len(self.getslice())
 
+    def getitems(self, indices):
+        """ Return the elements at the given (0-based) indices
+
+        Elements are returned in the order of indices; indices that are
+        negative or past the end of the list are skipped. Indices on the same
+        or neighbouring pages are fetched with a single getslice call, so no
+        page is requested more than once.
+        """
+        elements = {}
+
+        def fetch(run):
+            elements.update(zip(
+                range(run[0], run[-1] + 1), self.getslice(run[0], run[-1] + 1)))
+
+        run = []
+        for idx in sorted(set(i for i in indices if i >= 0)):
+            if run and idx // self._pagesize > run[-1] // self._pagesize + 1:
+                fetch(run)
+                run = []
+            run.append(idx)
+        if run:
+            fetch(run)
+        return [elements[idx] for idx in indices if idx in elements]
+
+    def _fetch_pages(self, pagenums):
+        """ Yield the results of the pages in pagenums in order, requesting
+        the following ones while a page is being consumed """
+        return parallel_map(
+            lambda pagenum: list(self._pagefunc(pagenum)), pagenums,
+            self._PAGE_WORKERS)
+
 
 class OnDemandPagedList(PagedList):
     def __init__(self, pagefunc, pagesize):
@@ -1570,39 +1743,49 @@ class OnDemandPagedList(PagedList):
 
     def getslice(self, start=0, end=None):
         res = []
-        for pagenum in itertools.count(start // self._pagesize):
-            firstid = pagenum * self._pagesize
-            nextfirstid = pagenum * self._pagesize + self._pagesize
-            if start >= nextfirstid:
-                continue
-
-            page_results = list(self._pagefunc(pagenum))
-
-            startv = (
-                start % self._pagesize
-                if firstid <= start < nextfirstid
-                else 0)
-
-            endv = (
-                ((end - 1) % self._pagesize) + 1
-                if (end is not None and firstid <= end <= nextfirstid)
-                else None)
-
-            if startv != 0 or endv is not None:
-                page_results = page_results[startv:endv]
-            res.extend(page_results)
-
-            # A little optimization - if current page is not "full", ie. does
-            # not contain page_size videos then we can assume that this page
-            # is the last one - there are no more ids on further pages -
-            # i.e. no need to query again.
-            if len(page_results) + startv < self._pagesize:
-                break
+        first_page = start // self._pagesize
+        # Pages past the one holding the last requested element are never
+        # needed; other pages are requested ahead until a short one shows
+        # the end of the list
+        if end is None:
+            pagenums = itertools.count(first_page)
+        else:
+            pagenums = range(first_page, max(first_page, (end - 1) // self._pagesize) + 1)
+        pages = self._fetch_pages(pagenums)
+        try:
+            for pagenum, page_results in enumerate(pages, first_page):
+                firstid = pagenum * self._pagesize
+                nextfirstid = pagenum * self._pagesize + self._pagesize
+
+                startv = (
+                    start % self._pagesize
+                    if firstid <= start < nextfirstid
+                    else 0)
+
+                endv = (
+                    ((end - 1) % self._pagesize) + 1
+                    if (end is not None and firstid <= end <= nextfirstid)
+                    else None)
+
+                if startv != 0 or endv is not None:
+                    page_results = page_results[startv:endv]
+                res.extend(page_results)
+
+                # A little optimization - if current page is not "full", ie. does
+                # not contain page_size videos then we can assume that this page
+                # is the last one - there are no more ids on further pages -
+                # i.e. no need to query again.
+                if len(page_results) + startv < self._pagesize:
+                    break
 
-            # If we got the whole page, but the next page is not interesting,
-            # break out early as well
-            if end == nextfirstid:
-                break
+                # If we got the whole page, but the next page is not interesting,
+                # break out early as well
+                if end == nextfirstid:
+                    break
+        finally:
+            # Pages requested ahead past the end are left to finish on their
+            # own, their results are not needed
+            pages.close()
         return res
 
 
@@ -1616,22 +1799,25 @@ class InAdvancePagedList(PagedList):
         res = []
         start_page = start // self._pagesize
         end_page = (
-            self._pagecount if end is None else (end // self._pagesize + 1))
+            self._pagecount if end is None else min(self._pagecount, end // self._pagesize + 1))
         skip_elems = start - start_page * self._pagesize
         only_more = None if end is None else end - start
-        for pagenum in range(start_page, end_page):
-            page = list(self._pagefunc(pagenum))
-            if skip_elems:
-                page = page[skip_elems:]
-                skip_elems = None
-            if only_more is not None:
-                if len(page) < only_more:
-                    only_more -= len(page)
-                else:
-                    page = page[:only_more]
-                    res.extend(page)
-                    break
-            res.extend(page)
+        pages = self._fetch_pages(range(start_page, end_page))
+        try:
+            for page in pages:
+                if skip_elems:
+                    page = page[skip_elems:]
+                    skip_elems = None
+                if only_more is not None:
+                    if len(page) < only_more:
+                        only_more -= len(page)
+                    else:
+                        page = page[:only_more]
+                        res.extend(page)
+                        break
+                res.extend(page)
+        finally:
+            pages.close()
         return res
 
 
@@ -1737,29 +1923,41 @@ def strip_jsonp(code):
         r'(?s)^[a-zA-Z0-9_]+\s*\(\s*(.*)\);?\s*?(?://[^\n]*)*$', r'\1', code)
 
 
+_JS_TO_JSON_RE = re.compile(r"""(?x)
+    (?P<dq>"(?:[^"\\]*(?:\\\\|\\['"nu]))*[^"\\]*")|
+    (?P<sq>'(?:[^'\\]*(?:\\\\|\\['"nu]))*[^'\\]*')|
+    (?P<id>[a-zA-Z_][.a-zA-Z_0-9]*)|
+    ,(?=\s*[\]}])
+    """)
+_JS_SQ_ESCAPE_RE = re.compile(r"""\\\\|\\'|\"""")
+_JS_SQ_ESCAPES = {
+    '\\\\': '\\\\',
+    "\\'": "'",
+    '"': '\\"',
+}
+
+
 def js_to_json(code):
-    def fix_kv(m):
+    def fix_token(m):
+        kind = m.lastgroup
         v = m.group(0)
-        if v in ('true', 'false', 'null'):
-            return v
-        if v.startswith('"'):
-            v = re.sub(r"\\'", "'", v[1:-1])
-        elif v.startswith("'"):
+        if kind is None:
+            # Trailing comma
+            return ''
+        elif kind == 'id':
+            if v in ('true', 'false', 'null'):
+                return v
+        elif kind == 'dq':
+            v = v[1:-1]
+            if "\\'" in v:
+                v = v.replace("\\'", "'")
+        else:
             v = v[1:-1]
-            v = re.sub(r"\\\\|\\'|\"", lambda m: {
-                '\\\\': '\\\\',
-                "\\'": "'",
-                '"': '\\"',
-            }[m.group(0)], v)
+            if '\\' in v or '"' in v:
+                v = _JS_SQ_ESCAPE_RE.sub(lambda m: _JS_SQ_ESCAPES[m.group(0)], v)
         return '"%s"' % v
 
-    res = re.sub(r'''(?x)
-        "(?:[^"\\]*(?:\\\\|\\['"nu]))*[^"\\]*"|
-        '(?:[^'\\]*(?:\\\\|\\['"nu]))*[^'\\]*'|
-        [a-zA-Z_][.a-zA-Z_0-9]*
-        ''', fix_kv, code)
-    res = re.sub(r',(\s*[\]}])', lambda m: m.group(1), res)
-    return res
+    return _JS_TO_JSON_RE.sub(fix_token, code)
 
 
 def qualities(quality_ids):
@@ -2004,51 +2202,70 @@ def srt_subtitles_timecode(seconds):
     return '%02d:%02d:%02d,%03d' % (seconds / 3600, (seconds % 3600) / 60, seconds % 60, (seconds % 1) * 1000)
 
 
-def dfxp2srt(dfxp_data):
-    _x = functools.partial(xpath_with_ns, ns_map={
-        'ttml': 'http://www.w3.org/ns/ttml',
-        'ttaf1': 'http://www.w3.org/2006/10/ttaf1',
-    })
-
-    def parse_node(node):
-        str_or_empty = functools.partial(str_or_none, default='')
+_DFXP_NAMESPACES = ('http://www.w3.org/ns/ttml', 'http://www.w3.org/2006/10/ttaf1')
+_DFXP_P_TAGS = tuple('{%s}p' % ns for ns in _DFXP_NAMESPACES) + ('p',)
+_DFXP_BR_TAGS = tuple('{%s}br' % ns for ns in _DFXP_NAMESPACES) + ('br',)
+_DFXP_SPAN_TAGS = tuple('{%s}span' % ns for ns in _DFXP_NAMESPACES) + ('span',)
 
-        out = str_or_empty(node.text)
 
-        for child in node:
-            if child.tag in (_x('ttml:br'), _x('ttaf1:br'), 'br'):
-                out += '\n' + str_or_empty(child.tail)
-            elif child.tag in (_x('ttml:span'), _x('ttaf1:span'), 'span'):
-                out += str_or_empty(parse_node(child))
-            else:
-                out += str_or_empty(xml.etree.ElementTree.tostring(child))
+def _dfxp_node_text(node, out):
+    if node.text is not None:
+        out.append(node.text)
+    for child in node:
+        if child.tag in _DFXP_BR_TAGS:
+            out.append('\n')
+            if child.tail is not None:
+                out.append(child.tail)
+        elif child.tag in _DFXP_SPAN_TAGS:
+            _dfxp_node_text(child, out)
+        else:
+            out.append(str_or_none(xml.etree.ElementTree.tostring(child), default=''))
 
-        return out
 
-    dfxp = compat_etree_fromstring(dfxp_data.encode('utf-8'))
-    out = []
-    paras = dfxp.findall(_x('.//ttml:p')) or dfxp.findall(_x('.//ttaf1:p')) or dfxp.findall('.//p')
+def dfxp2srt_iter(dfxp_file):
+    """ Convert a dfxp (TTML) file object to SRT, yielding one cue at a time
 
-    if not paras:
+    Paragraphs are removed from the tree as soon as they are converted, so
+    memory use does not grow with the length of the subtitles.
+    """
+    p_tag = None
+    index = 0
+    parents = []
+    for event, elem in xml.etree.ElementTree.iterparse(dfxp_file, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag not in _DFXP_P_TAGS:
+            continue
+        # Only paragraphs in the namespace of the first one are converted
+        if p_tag is None:
+            p_tag = elem.tag
+        if elem.tag == p_tag:
+            index += 1
+            begin_time = parse_dfxp_time_expr(elem.attrib.get('begin'))
+            end_time = parse_dfxp_time_expr(elem.attrib.get('end'))
+            dur = parse_dfxp_time_expr(elem.attrib.get('dur'))
+            if begin_time is not None and (end_time or dur):
+                if not end_time:
+                    end_time = begin_time + dur
+                text = []
+                _dfxp_node_text(elem, text)
+                yield '%d\n%s --> %s\n%s\n\n' % (
+                    index,
+                    srt_subtitles_timecode(begin_time),
+                    srt_subtitles_timecode(end_time),
+                    ''.join(text))
+        # The paragraph has just ended, so it is the last child of its parent
+        if parents:
+            del parents[-1][-1]
+
+    if not index:
         raise ValueError('Invalid dfxp/TTML subtitle')
 
-    for para, index in zip(paras, itertools.count(1)):
-        begin_time = parse_dfxp_time_expr(para.attrib.get('begin'))
-        end_time = parse_dfxp_time_expr(para.attrib.get('end'))
-        dur = parse_dfxp_time_expr(para.attrib.get('dur'))
-        if begin_time is None:
-            continue
-        if not end_time:
-            if not dur:
-                continue
-            end_time = begin_time + dur
-        out.append('%d\n%s --> %s\n%s\n\n' % (
-            index,
-            srt_subtitles_timecode(begin_time),
-            srt_subtitles_timecode(end_time),
-            parse_node(para)))
-
-    return ''.join(out)
+
+def dfxp2srt(dfxp_data):
+    return ''.join(dfxp2srt_iter(io.BytesIO(dfxp_data.encode('utf-8'))))
 
 
 def cli_option(params, command_option, param):